@@ -0,0 +1,109 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+from embedding_cache import normalize_query
+
+
+@dataclass
+class _Entry:
+    embedding: List[float]
+    answer: str
+    created: float
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def history_key(history: str) -> str:
+    if not history:
+        return ""
+    return hashlib.sha1(history.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    # Answers are only reused when retrieval returned the same sections and the
+    # conversation history matches, so similarity alone never crosses topics.
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, maxsize: int = 512,
+                 version_fn: Optional[Callable[[], str]] = None) -> None:
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self.version_fn = version_fn
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = version_fn() if version_fn else ""
+
+    def _check_version(self) -> None:
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if now - entry.created > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, query: str, embedding: Optional[Sequence[float]], section_ids: Sequence[str],
+               history: str = "") -> Optional[str]:
+        # embedding may be None (e.g. exact citation lookups); then only the
+        # normalized query text is matched.
+        bucket = (tuple(sorted(section_ids)), history_key(history))
+        exact = bucket + (normalize_query(query),)
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self._evict_expired(now)
+
+            entry = self._entries.get(exact)
+            if entry is None and embedding is not None:
+                best = 0.0
+                for key, candidate in self._entries.items():
+                    if key[:2] != bucket:
+                        continue
+                    score = _cosine(embedding, candidate.embedding)
+                    if score >= self.threshold and score > best:
+                        best, exact, entry = score, key, candidate
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(exact)
+            self.hits += 1
+            return entry.answer
+
+    def store(self, query: str, embedding: Optional[Sequence[float]], section_ids: Sequence[str],
+              answer: str, history: str = "") -> None:
+        key = (tuple(sorted(section_ids)), history_key(history), normalize_query(query))
+        with self._lock:
+            self._check_version()
+            self._entries[key] = _Entry(list(embedding or []), answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "index_version": self._version,
+            }
@@ -0,0 +1,350 @@
+import asyncio
+import queue
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.staticfiles import StaticFiles
+from starlette.websockets import WebSocketDisconnect
+
+import runtime
+import stt_service
+import web_app
+from llm_client import LLMError
+from stt_service import PCMFramer, PoolBusy
+from web_app import BASE_DIR, MODEL_NAME
+
+# ================= CONFIG =================
+# Embedding/retrieval is CPU work and runs in a bounded thread pool; LLM calls
+# are async and gated so at most LLM_CONCURRENCY run at once, with up to
+# LLM_QUEUE_LIMIT requests waiting in FIFO order before we answer 429.
+# Speech recognition has its own pool with one thread per recognizer; waiting
+# for a free recognizer happens on the event loop, so voice uploads never hold
+# the threads that text queries need.
+RETRIEVAL_WORKERS = 4
+STT_CHECKOUT_POLL_SECONDS = 0.05
+LLM_CONCURRENCY = 2
+LLM_QUEUE_LIMIT = 32
+SESSION_COOKIE = "sid"
+BUSY_MESSAGE = "The assistant is busy right now. Please retry in a few seconds."
+
+executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="rag")
+stt_executor = ThreadPoolExecutor(max_workers=stt_service.STT_POOL_SIZE, thread_name_prefix="stt")
+# Same pooled client as the Flask app; its async methods keep a separate
+# connection pool on this event loop.
+llm = runtime.get_llm(MODEL_NAME)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class LLMGate:
+    def __init__(self, concurrency: int, queue_limit: int) -> None:
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def full(self) -> bool:
+        return self.waiting >= self.queue_limit
+
+    def position(self) -> int:
+        # 0 means a slot is free right now.
+        return self.waiting + max(0, self.active - self.concurrency + 1)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.full():
+            raise QueueFull()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "queue_limit": self.queue_limit,
+        }
+
+
+gate = LLMGate(LLM_CONCURRENCY, LLM_QUEUE_LIMIT)
+
+
+async def run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args))
+
+
+async def run_stt(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(stt_executor, partial(func, *args))
+
+
+async def checkout_recognizer():
+    # Polls the pool instead of blocking a thread for STT_ACQUIRE_TIMEOUT.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + stt_service.STT_ACQUIRE_TIMEOUT
+    while True:
+        try:
+            return await run_stt(stt_service.pool.checkout, 0)
+        except PoolBusy:
+            if loop.time() >= deadline:
+                raise
+        await asyncio.sleep(STT_CHECKOUT_POLL_SECONDS)
+
+
+def _session_id(request) -> tuple:
+    sid = request.cookies.get(SESSION_COOKIE)
+    if sid:
+        return sid, False
+    return str(uuid.uuid4()), True
+
+
+def _with_session(response, sid: str, is_new: bool):
+    if is_new:
+        response.set_cookie(SESSION_COOKIE, sid, httponly=True, samesite="lax")
+    return response
+
+
+async def _achat(plan: dict) -> str:
+    try:
+        raw = await llm.achat(plan["messages"])
+    except LLMError as exc:
+        return web_app._llm_failure(exc)
+    return web_app._finish_answer(plan, raw)
+
+
+async def _astream(plan: dict):
+    parts = []
+    try:
+        async for token in llm.astream(plan["messages"]):
+            parts.append(token)
+            yield "token", token
+    except LLMError as exc:
+        yield "done", web_app._llm_failure(exc)
+        return
+
+    yield "done", web_app._finish_answer(plan, "".join(parts))
+
+
+def _busy_response() -> JSONResponse:
+    return JSONResponse(
+        {"answer": BUSY_MESSAGE, "queue_position": gate.position()},
+        status_code=429,
+        headers={"Retry-After": "5"}
+    )
+
+
+async def index(request):
+    return FileResponse(BASE_DIR / "templates" / "index.html")
+
+
+async def health(request):
+    return JSONResponse({
+        "status": "ok",
+        "embedding_cache": web_app.query_embeddings.stats(),
+        "embedding_batches": web_app.batched_embedder.stats(),
+        "answer_cache": web_app.answer_cache.stats(),
+        "llm": gate.stats(),
+        "stt_pool": stt_service.pool.stats(),
+        "sessions": web_app.sessions.stats(),
+        "summarizer": web_app.summarizer.stats(),
+        "llm_client": llm.stats(),
+        "prefetch": web_app.prefetcher.stats(),
+        "shards": web_app.shard_stats(),
+    })
+
+
+async def _read_json(request) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    return data if isinstance(data, dict) else {}
+
+
+async def _read_query(request) -> str:
+    return ((await _read_json(request)).get("query") or "").strip()
+
+
+async def prefetch(request):
+    query = await _read_query(request)
+    sid, is_new = _session_id(request)
+    started = web_app.start_prefetch(query, sid)
+    return _with_session(JSONResponse({"prefetching": started}), sid, is_new)
+
+
+async def ask(request):
+    data = await _read_json(request)
+    query = (data.get("query") or "").strip()
+    where = web_app.request_filter(data)
+    if not query:
+        return JSONResponse({"answer": "Please enter a question."})
+    if gate.full():
+        return _busy_response()
+
+    sid, is_new = _session_id(request)
+    plan = await run_blocking(web_app._plan_answer, query, sid, where)
+    answer = plan["answer"]
+    if answer is None:
+        try:
+            async with gate.slot():
+                answer = await _achat(plan)
+        except QueueFull:
+            return _busy_response()
+
+    await run_blocking(web_app._remember_turn, sid, query, answer)
+    return _with_session(JSONResponse({"answer": answer}), sid, is_new)
+
+
+async def ask_stream(request):
+    data = await _read_json(request)
+    query = (data.get("query") or "").strip()
+    where = web_app.request_filter(data)
+    if gate.full():
+        return _busy_response()
+    sid, is_new = _session_id(request)
+
+    async def events():
+        if not query:
+            yield web_app._sse({"done": True, "answer": "Please enter a question."})
+            return
+        plan = await run_blocking(web_app._plan_answer, query, sid, where)
+        if plan["answer"] is not None:
+            await run_blocking(web_app._remember_turn, sid, query, plan["answer"])
+            yield web_app._sse({"token": plan["answer"]})
+            yield web_app._sse({"done": True, "answer": plan["answer"]})
+            return
+
+        position = gate.position()
+        if position:
+            yield web_app._sse({"queued": position})
+        try:
+            async with gate.slot():
+                async for kind, text in _astream(plan):
+                    if kind == "token":
+                        yield web_app._sse({"token": text})
+                    else:
+                        await run_blocking(web_app._remember_turn, sid, query, text)
+                        yield web_app._sse({"done": True, "answer": text})
+        except QueueFull:
+            yield web_app._sse({"done": True, "answer": BUSY_MESSAGE})
+
+    response = StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    return _with_session(response, sid, is_new)
+
+
+async def transcribe(request):
+    # Chunked upload of raw 16 kHz PCM. Chunks are handed to a pool thread as
+    # they arrive, so recognition overlaps with the upload.
+    try:
+        transcriber = await checkout_recognizer()
+    except PoolBusy:
+        return JSONResponse({"text": "", "error": "Speech recognizer busy. Please retry."}, status_code=503)
+    except FileNotFoundError as exc:
+        return JSONResponse({"text": "", "error": str(exc)}, status_code=503)
+
+    def recognize(chunks) -> str:
+        try:
+            return stt_service.transcribe_with(transcriber, chunks)
+        finally:
+            stt_service.pool.checkin(transcriber)
+
+    chunks: "queue.Queue" = queue.Queue()
+    job = asyncio.ensure_future(run_stt(recognize, iter(chunks.get, None)))
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > stt_service.MAX_UPLOAD_BYTES:
+                break
+            if chunk:
+                chunks.put(chunk)
+    finally:
+        chunks.put(None)
+    text = await job
+    return JSONResponse({"text": text})
+
+
+async def transcribe_ws(websocket):
+    # Binary messages carry PCM; the client sends the text message "end" when
+    # the user stops. Partials are sent back after every message.
+    await websocket.accept()
+    try:
+        transcriber = await checkout_recognizer()
+    except (PoolBusy, FileNotFoundError) as exc:
+        await websocket.send_json({"error": str(exc) or "Speech recognizer busy. Please retry."})
+        await websocket.close()
+        return
+
+    def feed(frames: list) -> str:
+        for frame in frames:
+            transcriber.accept(frame)
+        return transcriber.text
+
+    def finish(tail: bytes) -> str:
+        if tail:
+            transcriber.accept(tail)
+        return transcriber.finish()
+
+    framer = PCMFramer()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                if framer.total > stt_service.MAX_UPLOAD_BYTES:
+                    break
+                partial = await run_stt(feed, framer.feed(message["bytes"]))
+                await websocket.send_json({"partial": partial})
+            elif message.get("text") == "end":
+                break
+        text = await run_stt(finish, framer.flush())
+        await websocket.send_json({"text": text})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stt_service.pool.checkin(transcriber)
+
+
+app = Starlette(routes=[
+    Route("/", index),
+    Route("/health", health),
+    Route("/prefetch", prefetch, methods=["POST"]),
+    Route("/ask", ask, methods=["POST"]),
+    Route("/ask/stream", ask_stream, methods=["POST"]),
+    Route("/transcribe", transcribe, methods=["POST"]),
+    WebSocketRoute("/transcribe/ws", transcribe_ws),
+    Mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static"),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    threading.Thread(target=web_app.warm_up, daemon=True).start()
+    print("Starting async server on http://0.0.0.0:8000")
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,233 @@
+import argparse
+import time
+import wave
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# ---------- AUDIO CONFIG ----------
+SAMPLE_RATE = 16000
+CHANNELS = 1
+FRAME_DURATION_MS = 30
+FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
+FRAME_BYTES = FRAME_SIZE * 2
+MAX_SILENCE_FRAMES = int(0.8 * 1000 / FRAME_DURATION_MS)
+MIN_SPEECH_FRAMES = int(0.2 * 1000 / FRAME_DURATION_MS)
+NOISE_MULTIPLIER = 1.3
+MIN_NOISE_FLOOR = 200
+
+# ---------- DETECTOR CONFIG ----------
+HANGOVER_FRAMES = 3
+NOISE_ADAPT_RATE = 0.02
+MAX_SPEECH_ZCR = 0.5
+# Quiet frames only ever pull the floor towards their level; if room noise
+# rises above the threshold there are no quiet frames left. A low percentile
+# of the last NOISE_WINDOW_SECONDS of RMS, taken whatever the speech flags
+# say, lets the floor rise again (speech has pauses, steady noise does not).
+NOISE_WINDOW_SECONDS = 5.0
+NOISE_PERCENTILE = 10
+
+
+def frame_stats(block: bytes, frame_size: int = FRAME_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    # RMS and zero-crossing rate for every whole frame in the block at once.
+    samples = np.frombuffer(block, dtype=np.int16)
+    count = len(samples) // frame_size
+    frames = samples[:count * frame_size].reshape(count, frame_size).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return rms, zcr
+
+
+class SpeechDetector:
+    # Energy + ZCR speech detection with hangover smoothing and a noise floor
+    # that keeps adapting on non-speech frames and rises with sustained noise. webrtcvad, when available,
+    # adds a second vote per frame like the original loop did.
+    def __init__(self, sample_rate: int = SAMPLE_RATE, frame_size: int = FRAME_SIZE,
+                 multiplier: float = NOISE_MULTIPLIER, min_floor: float = MIN_NOISE_FLOOR,
+                 hangover_frames: int = HANGOVER_FRAMES, adapt_rate: float = NOISE_ADAPT_RATE,
+                 use_webrtcvad: bool = True, vad_mode: int = 1) -> None:
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.multiplier = multiplier
+        self.min_floor = min_floor
+        self.hangover_frames = hangover_frames
+        self.adapt_rate = adapt_rate
+        self.noise_floor = min_floor / multiplier
+        self._history = np.zeros(hangover_frames, dtype=bool)
+        self._window = np.zeros(max(1, int(NOISE_WINDOW_SECONDS * sample_rate / frame_size)), dtype=np.float32)
+        self._window_pos = 0
+        self._window_filled = 0
+        self.vad = None
+        if use_webrtcvad:
+            try:
+                import webrtcvad
+                self.vad = webrtcvad.Vad(vad_mode)
+            except ImportError:
+                self.vad = None
+
+    @property
+    def threshold(self) -> int:
+        return int(max(self.min_floor, self.noise_floor * self.multiplier))
+
+    def calibrate(self, block: bytes) -> int:
+        rms, _ = frame_stats(block, self.frame_size)
+        if len(rms):
+            self.noise_floor = float(np.mean(rms))
+        self._window_pos = self._window_filled = 0
+        return self.threshold
+
+    def _track_noise(self, rms: np.ndarray) -> None:
+        size = len(self._window)
+        recent = rms[-size:]
+        index = (self._window_pos + np.arange(len(recent))) % size
+        self._window[index] = recent
+        self._window_pos = int((self._window_pos + len(recent)) % size)
+        self._window_filled = min(size, self._window_filled + len(recent))
+        if self._window_filled < size:
+            return
+        low = float(np.percentile(self._window, NOISE_PERCENTILE))
+        if low > self.noise_floor:
+            keep = (1.0 - self.adapt_rate) ** len(rms)
+            self.noise_floor = keep * self.noise_floor + (1.0 - keep) * low
+
+    def process(self, block: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns (is_speech, rms) arrays with one entry per frame in the block.
+        rms, zcr = frame_stats(block, self.frame_size)
+        if not len(rms):
+            return np.zeros(0, dtype=bool), rms
+
+        raw = (rms >= self.threshold) & (zcr <= MAX_SPEECH_ZCR)
+        if self.vad is not None:
+            step = self.frame_size * 2
+            votes = [self.vad.is_speech(block[i * step:(i + 1) * step], self.sample_rate) for i in range(len(rms))]
+            raw |= np.array(votes, dtype=bool)
+
+        if self.hangover_frames:
+            padded = np.concatenate([self._history, raw]).astype(np.int32)
+            smoothed = np.convolve(padded, np.ones(self.hangover_frames + 1, dtype=np.int32), "valid") > 0
+            self._history = padded[-self.hangover_frames:].astype(bool)
+        else:
+            smoothed = raw
+
+        quiet = rms[~smoothed]
+        if len(quiet):
+            keep = (1.0 - self.adapt_rate) ** len(quiet)
+            self.noise_floor = keep * self.noise_floor + (1.0 - keep) * float(np.mean(quiet))
+        self._track_noise(rms)
+        return smoothed, rms
+
+
+class UtteranceSegmenter:
+    # Turns per-frame speech flags into utterance boundaries.
+    # push() returns "idle", "start", "speech", "silence" or "end".
+    def __init__(self, max_silence_frames: int = MAX_SILENCE_FRAMES,
+                 min_speech_frames: int = MIN_SPEECH_FRAMES) -> None:
+        self.max_silence_frames = max_silence_frames
+        self.min_speech_frames = min_speech_frames
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = False
+        self.speech_frames = 0
+        self.silence_frames = 0
+
+    def push(self, is_speech: bool) -> str:
+        if is_speech:
+            state = "speech" if self.started else "start"
+            self.started = True
+            self.speech_frames += 1
+            self.silence_frames = 0
+            return state
+        if not self.started:
+            return "idle"
+        self.silence_frames += 1
+        if self.silence_frames >= self.max_silence_frames:
+            return "end"
+        return "silence"
+
+    @property
+    def long_enough(self) -> bool:
+        return self.speech_frames >= self.min_speech_frames
+
+
+def read_block(stream, max_frames: int = 32) -> bytes:
+    # Reads every whole frame already buffered by PyAudio (at least one), so a
+    # backlog is processed as one block instead of frame by frame.
+    available = stream.get_read_available() // FRAME_SIZE
+    frames = min(max(1, available), max_frames)
+    return stream.read(FRAME_SIZE * frames, exception_on_overflow=False)
+
+
+def calibrate_stream(stream, detector: SpeechDetector, seconds: float = 1.0) -> int:
+    frames = int(seconds * 1000 / FRAME_DURATION_MS)
+    block = stream.read(FRAME_SIZE * frames, exception_on_overflow=False)
+    return detector.calibrate(block)
+
+
+def iter_frames(block: bytes, frame_bytes: int = FRAME_BYTES) -> Iterator[bytes]:
+    for start in range(0, len(block) - frame_bytes + 1, frame_bytes):
+        yield block[start:start + frame_bytes]
+
+
+def iter_wav_blocks(path, block_frames: int = 32) -> Iterator[bytes]:
+    # Reads 16 kHz mono 16-bit WAV files in blocks of whole frames so the
+    # front-end can be run and benchmarked without a microphone.
+    with wave.open(str(path), "rb") as wav:
+        if wav.getframerate() != SAMPLE_RATE or wav.getnchannels() != CHANNELS or wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected {SAMPLE_RATE} Hz mono 16-bit PCM")
+        while True:
+            block = wav.readframes(FRAME_SIZE * block_frames)
+            if len(block) < FRAME_BYTES:
+                return
+            yield block[:len(block) - len(block) % FRAME_BYTES]
+
+
+def analyze_wav(path, detector: Optional[SpeechDetector] = None, block_frames: int = 32) -> dict:
+    detector = detector or SpeechDetector()
+    segmenter = UtteranceSegmenter()
+    frames = speech = 0
+    utterances = []
+    start_frame = 0
+    began = time.perf_counter()
+
+    for block in iter_wav_blocks(path, block_frames):
+        flags, _ = detector.process(block)
+        for flag in flags:
+            state = segmenter.push(bool(flag))
+            if state == "start":
+                start_frame = frames
+            elif state == "end":
+                if segmenter.long_enough:
+                    utterances.append((start_frame * FRAME_DURATION_MS / 1000, frames * FRAME_DURATION_MS / 1000))
+                segmenter.reset()
+            frames += 1
+            speech += int(flag)
+
+    elapsed = time.perf_counter() - began
+    audio_seconds = frames * FRAME_DURATION_MS / 1000
+    return {
+        "frames": frames,
+        "speech_frames": speech,
+        "audio_seconds": audio_seconds,
+        "elapsed_seconds": elapsed,
+        "real_time_factor": elapsed / audio_seconds if audio_seconds else 0.0,
+        "noise_threshold": detector.threshold,
+        "utterances": utterances,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the VAD/energy front-end over WAV files.")
+    parser.add_argument("wav", nargs="+", help="16 kHz mono 16-bit WAV files")
+    parser.add_argument("--block-frames", type=int, default=32)
+    parser.add_argument("--no-webrtcvad", action="store_true")
+    args = parser.parse_args()
+
+    for path in args.wav:
+        stats = analyze_wav(path, SpeechDetector(use_webrtcvad=not args.no_webrtcvad), args.block_frames)
+        print(
+            f"{path}: {stats['audio_seconds']:.1f}s audio, {stats['speech_frames']}/{stats['frames']} speech frames, "
+            f"{len(stats['utterances'])} utterances, RTF {stats['real_time_factor']:.4f}, "
+            f"threshold {stats['noise_threshold']}"
+        )
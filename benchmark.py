@@ -0,0 +1,452 @@
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+# ================= CONFIG =================
+BASE_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BASE_DIR / "bench_results"
+STAGES = ["ingest", "retrieval", "ask", "stt"]
+INGEST_SIZES = [10, 100, 1000, 10000, 100000]
+RETRIEVAL_REPEATS = 5
+ASK_REQUESTS = 40
+ASK_CORPUS_SIZE = 1000
+ASK_CONCURRENCY = 8
+STUB_TOKENS_PER_SECOND = 50.0
+STUB_FIRST_TOKEN_MS = 100
+SYNTHETIC_AUDIO_SECONDS = 10
+EMBED_DIM = 384
+
+QUERIES = [
+    "What is the punishment for theft of a mobile phone?",
+    "Someone cheated me and took money for a fake job offer",
+    "My neighbour threatened to kill me, what can I do?",
+    "What happens if a person is caught with stolen property?",
+    "Is dishonestly taking a bicycle without consent an offence?",
+    "A shopkeeper sold me a fake product and refuses a refund",
+    "What is criminal breach of trust by an employee?",
+    "Can I file an FIR if my landlord kept my belongings?",
+]
+CITATION_QUERIES = ["IPC 379", "section 420", "What does IPC section 378 say?"]
+
+_OFFENCES = [
+    "theft", "cheating", "criminal breach of trust", "mischief", "criminal intimidation",
+    "extortion", "robbery", "forgery", "criminal trespass", "defamation", "assault",
+    "wrongful restraint", "dishonest misappropriation", "receiving stolen property",
+]
+_ACTS = [
+    "taking movable property", "dishonestly inducing delivery of property", "causing wrongful loss",
+    "using criminal force", "making a false document", "entering property with intent to annoy",
+    "threatening injury to person or reputation", "obstructing a person from proceeding",
+]
+_PUNISHMENTS = [
+    "imprisonment of either description for a term which may extend to {n} years, or with fine, or with both",
+    "imprisonment for a term which may extend to {n} years and shall also be liable to fine",
+    "simple imprisonment for a term which may extend to {n} months, or with fine",
+]
+
+
+# ================= HELPERS =================
+def synthetic_sections(count: int, seed: int = 0) -> Iterator[str]:
+    # IPC-style sections ("IPC Section N:" + definition or punishment text),
+    # deterministic for a given seed so runs are comparable.
+    rng = random.Random(seed)
+    for i in range(count):
+        number = 100 + i
+        offence = rng.choice(_OFFENCES)
+        if i % 2:
+            body = f"Punishment for {offence} is " + rng.choice(_PUNISHMENTS).format(n=rng.randint(1, 10)) + "."
+        else:
+            body = (
+                f"Whoever commits {offence} by {rng.choice(_ACTS)} without consent, "
+                f"intending to cause {rng.choice(['wrongful gain', 'wrongful loss', 'annoyance', 'alarm'])}, "
+                f"is said to commit {offence}. Illustration {rng.randint(1, 9)}: "
+                f"A, {rng.choice(_ACTS)}, commits {offence}."
+            )
+        yield f"IPC Section {number}:\n{body}"
+
+
+class HashEmbedder:
+    # Deterministic bag-of-words vectors with the real model's dimension, for
+    # measuring storage and search cost without a model forward pass.
+    def __init__(self, dim: int = EMBED_DIM) -> None:
+        self.dim = dim
+
+    def _vector(self, text: str):
+        import numpy as np
+
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vec[zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False):
+        import numpy as np
+
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return np.stack([self._vector(t) for t in texts])
+
+
+def percentiles(samples_ms: List[float]) -> dict:
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": pick(50),
+        "p95_ms": pick(95),
+        "p99_ms": pick(99),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_synthetic_wav(path: Path, seconds: float, sample_rate: int = 16000) -> None:
+    # Background noise with bursts of a voiced-like harmonic tone.
+    rng = random.Random(1)
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        samples = []
+        for i in range(int(seconds * sample_rate)):
+            t = i / sample_rate
+            voiced = int(t) % 3 != 2
+            tone = sum(math.sin(2 * math.pi * f * t) for f in (140, 280, 420)) * 2500 if voiced else 0.0
+            samples.append(int(max(-32768, min(32767, tone + rng.gauss(0, 150)))))
+        wav.writeframes(struct.pack(f"<{len(samples)}h", *samples))
+
+
+# ================= STAGES =================
+def bench_ingest(sizes: List[int], embedder, workdir: Path, backend: str) -> tuple:
+    from runtime import open_vector_store
+    from vector_store import build_index
+
+    client = open_vector_store(backend, workdir / backend)
+    results = {}
+    collection = None
+    for size in sizes:
+        collection = client.get_or_create_collection(f"bench_{size}")
+        began = time.perf_counter()
+        stats = build_index(synthetic_sections(size), collection, embedder,
+                            write_batch_size=client.get_max_batch_size())
+        elapsed = time.perf_counter() - began
+        # Keyed by corpus size so --compare lines up runs with different --sizes.
+        results[str(size)] = {
+            "chunks": stats["total"],
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(stats["total"] / elapsed, 1) if elapsed else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        print(f"ingest {size:>7} chunks: {elapsed:.2f}s ({results[str(size)]['chunks_per_second']} chunks/s)")
+    return results, collection
+
+
+def bench_retrieval(collection, embedder, repeats: int) -> dict:
+    from retrieval import search_sections
+
+    def encode(text: str):
+        return embedder.encode(text).tolist()
+
+    # First call builds the BM25 index; report it separately.
+    began = time.perf_counter()
+    search_sections(QUERIES[0], collection, encode)
+    warm_ms = (time.perf_counter() - began) * 1000
+
+    semantic, citations = [], []
+    for _ in range(repeats):
+        for query in QUERIES:
+            began = time.perf_counter()
+            search_sections(query, collection, encode)
+            semantic.append((time.perf_counter() - began) * 1000)
+        for query in CITATION_QUERIES:
+            began = time.perf_counter()
+            search_sections(query, collection, encode)
+            citations.append((time.perf_counter() - began) * 1000)
+    result = {
+        "collection_size": collection.count(),
+        "first_query_ms": round(warm_ms, 3),
+        "semantic": percentiles(semantic),
+        "citation": percentiles(citations),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f"retrieval ({result['collection_size']} chunks): p50 {result['semantic'].get('p50_ms')} ms, "
+          f"p95 {result['semantic'].get('p95_ms')} ms, p99 {result['semantic'].get('p99_ms')} ms")
+    return result
+
+
+def bench_ask(total: int, concurrency: int, use_answer_cache: bool, corpus_size: int) -> dict:
+    # Runs the real Flask app on a local port against llm_stub_server.py, so
+    # the numbers cover retrieval, prompt building and streaming overhead.
+    # main() has pointed the index and session/query caches at the temp dir;
+    # the app searches a synthetic corpus embedded with its own model.
+    import httpx
+    from werkzeug.serving import make_server
+
+    import runtime
+    from answer_cache import AnswerCache
+    from vector_store import build_index
+
+    client = runtime.get_client()
+    began = time.perf_counter()
+    build_index(synthetic_sections(corpus_size), runtime.get_collection(), runtime.get_embedder(),
+                write_batch_size=client.get_max_batch_size())
+    print(f"/ask corpus: {corpus_size} chunks in {time.perf_counter() - began:.2f}s")
+
+    import web_app
+
+    web_app.answer_cache = AnswerCache(maxsize=web_app.answer_cache.maxsize if use_answer_cache else 0)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port = free_port()
+    server = make_server("127.0.0.1", port, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{port}"
+
+    def one(i: int) -> dict:
+        query = f"{QUERIES[i % len(QUERIES)]} (case {i})"
+        began = time.perf_counter()
+        first = None
+        with httpx.Client(base_url=url, timeout=120) as client:
+            with client.stream("POST", "/ask/stream", json={"query": query}) as response:
+                for line in response.iter_lines():
+                    if first is None and line.startswith("data: ") and '"token"' in line:
+                        first = time.perf_counter()
+        done = time.perf_counter()
+        return {"total_ms": (done - began) * 1000, "ttft_ms": ((first or done) - began) * 1000}
+
+    try:
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            runs = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - began
+    finally:
+        server.shutdown()
+
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "answer_cache": use_answer_cache,
+        "corpus_size": corpus_size,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 2) if elapsed else None,
+        "time_to_first_token": percentiles([r["ttft_ms"] for r in runs]),
+        "total": percentiles([r["total_ms"] for r in runs]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f"/ask/stream x{total} @ {concurrency}: {result['requests_per_second']} req/s, "
+          f"TTFT p95 {result['time_to_first_token'].get('p95_ms')} ms")
+    return result
+
+
+def bench_stt(wavs: List[Path], workdir: Path) -> dict:
+    from audio_frontend import SAMPLE_RATE, SpeechDetector, analyze_wav, iter_frames, iter_wav_blocks
+
+    if not wavs:
+        synthetic = workdir / "synthetic.wav"
+        write_synthetic_wav(synthetic, SYNTHETIC_AUDIO_SECONDS)
+        wavs = [synthetic]
+
+    import runtime
+    from streaming_stt import StreamingTranscriber
+
+    began = time.perf_counter()
+    model = runtime.get_vosk_model()
+    load_seconds = time.perf_counter() - began
+    transcriber = StreamingTranscriber(model, SAMPLE_RATE)
+
+    files = []
+    for path in wavs:
+        vad = analyze_wav(path, SpeechDetector())
+        transcriber.reset()
+        began = time.perf_counter()
+        for block in iter_wav_blocks(path):
+            for frame in iter_frames(block):
+                transcriber.accept(frame)
+        text = transcriber.finish()
+        elapsed = time.perf_counter() - began
+        audio = vad["audio_seconds"]
+        files.append({
+            "file": str(path),
+            "audio_seconds": audio,
+            "vad_rtf": round(vad["real_time_factor"], 5),
+            "stt_rtf": round(elapsed / audio, 4) if audio else None,
+            "words": len(text.split()),
+        })
+        print(f"stt {Path(path).name}: {audio:.1f}s audio, STT RTF {files[-1]['stt_rtf']}, VAD RTF {files[-1]['vad_rtf']}")
+    return {"model_load_seconds": round(load_seconds, 3), "files": files, "peak_rss_mb": peak_rss_mb()}
+
+
+# ================= REPORT =================
+def _flatten(data, prefix: str = "") -> dict:
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(_flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            flat.update(_flatten(value, f"{prefix}{i}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix[:-1]] = data
+    return flat
+
+
+def compare(baseline_path: Path, results: dict) -> None:
+    baseline = _flatten(json.loads(Path(baseline_path).read_text())["results"])
+    current = _flatten(results["results"])
+    print(f"\nChange vs {baseline_path}:")
+    for key in sorted(current):
+        if key in baseline and baseline[key]:
+            delta = (current[key] - baseline[key]) / abs(baseline[key]) * 100
+            print(f"  {key:<55} {baseline[key]:>12g} -> {current[key]:>12g} ({delta:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark ingest, retrieval, /ask and STT; writes JSON.")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma separated subset of {STAGES}")
+    parser.add_argument("--sizes", default=",".join(map(str, INGEST_SIZES)), help="Synthetic corpus sizes")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="'hash' skips the model to measure storage/search only")
+    parser.add_argument("--vector-store", choices=["chroma", "mmap"],
+                        help="Index backend for ingest/retrieval (default: LEGAL_VECTOR_BACKEND)")
+    parser.add_argument("--repeats", type=int, default=RETRIEVAL_REPEATS)
+    parser.add_argument("--requests", type=int, default=ASK_REQUESTS)
+    parser.add_argument("--concurrency", type=int, default=ASK_CONCURRENCY)
+    parser.add_argument("--ask-corpus", type=int, default=ASK_CORPUS_SIZE, help="Synthetic sections behind /ask")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache on during /ask")
+    parser.add_argument("--stub-rate", type=float, default=STUB_TOKENS_PER_SECOND)
+    parser.add_argument("--stub-first-token-ms", type=float, default=STUB_FIRST_TOKEN_MS)
+    parser.add_argument("--wav", nargs="*", default=[], help="16 kHz mono WAV fixtures for the STT stage")
+    parser.add_argument("--out", help="Result file (default: bench_results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier result file to diff against")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    # Everything a run writes stays in this directory; for /ask the app's index,
+    # sessions and query-embedding cache are moved there too.
+    tmp = tempfile.TemporaryDirectory(prefix="legal-bench-")
+    workdir = Path(tmp.name)
+    if args.vector_store:
+        os.environ["LEGAL_VECTOR_BACKEND"] = args.vector_store
+
+    stub = None
+    if "ask" in stages:
+        # Must be set before runtime.py is imported.
+        from llm_stub_server import serve as serve_stub
+
+        os.environ["LEGAL_DB_PATH"] = str(workdir / "ask" / "chroma_db")
+        os.environ["LEGAL_MMAP_PATH"] = str(workdir / "ask" / "mmap_index")
+        os.environ["LEGAL_STATE_DIR"] = str(workdir / "ask" / "state")
+
+        port = free_port()
+        stub = serve_stub("127.0.0.1", port, args.stub_rate, args.stub_first_token_ms)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        os.environ["LEGAL_LLM_BACKEND"] = "ollama"
+        os.environ["LEGAL_LLM_HOST"] = f"http://127.0.0.1:{port}"
+
+    import runtime
+
+    embedder = HashEmbedder() if args.embedder == "hash" else runtime.get_embedder()
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "stages": stages,
+            "embedder": "hash" if args.embedder == "hash" else runtime.EMBED_BACKEND,
+            "vector_store": args.vector_store or runtime.VECTOR_BACKEND,
+            "sizes": [int(s) for s in args.sizes.split(",") if s],
+            "stub_tokens_per_second": args.stub_rate,
+            "stub_first_token_ms": args.stub_first_token_ms,
+        },
+        "results": {},
+    }
+    results = report["results"]
+
+    with tmp:
+        collection = None
+        if "ingest" in stages or "retrieval" in stages:
+            sizes = report["config"]["sizes"] if "ingest" in stages else report["config"]["sizes"][-1:]
+            results["ingest"], collection = bench_ingest(sizes, embedder, workdir, report["config"]["vector_store"])
+        if "retrieval" in stages and collection is not None:
+            results["retrieval"] = bench_retrieval(collection, embedder, args.repeats)
+        if "ask" in stages:
+            results["ask"] = bench_ask(args.requests, args.concurrency, args.answer_cache, args.ask_corpus)
+        if "stt" in stages:
+            try:
+                results["stt"] = bench_stt([Path(p) for p in args.wav], workdir)
+            except FileNotFoundError as exc:
+                results["stt"] = {"error": str(exc)}
+                print(f"stt skipped: {exc}")
+
+    if stub is not None:
+        stub.shutdown()
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{report['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"\nPeak RSS: {report['peak_rss_mb']} MB")
+    print(f"Results written to {out}")
+    if args.compare:
+        compare(Path(args.compare), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,136 @@
+import io
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+from legal_metadata import section_metadata
+
+# Acts whose "<Act> Section N" lines start a new section. Body text such as
+# "Under Section 34 of the Code" must not split a section, so the act is
+# limited to this list; add an abbreviation here before ingesting a new Act.
+ACTS = ("IPC", "BNS", "BNSS", "BSA", "CrPC")
+SECTION_PATTERN = re.compile(
+    r"^(?P<act>(?i:" + "|".join(ACTS) + r"))\s+Section\s+(?P<number>\d+[A-Za-z]*)\s*[:.\-]?\s*(?P<title>.*)$"
+)
+CHAPTER_PATTERN = re.compile(r"^CHAPTER\s+(?P<numeral>[IVXLC]+[A-Z]?)\b\s*[:.\-]?\s*(?P<title>.*)$")
+
+
+@dataclass(frozen=True)
+class Section:
+    act: str
+    number: str
+    title: str
+    header: str
+    body: str
+    start: int
+    end: int
+    chapter: str = ""
+    chapter_title: str = ""
+
+    @property
+    def text(self) -> str:
+        return " ".join(part for part in (self.header, self.body) if part)
+
+
 def load_legal_data(path):
     with open(path, "r", encoding="utf-8") as file:
         return file.read()
 
 
-def chunk_by_section(text):
-    lines = text.split("\n")
-    chunks = []
+def _iter_sections(lines: Iterable[bytes]) -> Iterator[Section]:
+    # Body lines are collected in a list and joined once per section, so the
+    # cost stays linear in the section length and only one section is held at a time.
+    # "CHAPTER XVII" lines (title on the same or the next line) are not part of
+    # any section; they set the chapter of the sections that follow.
+    match: Optional[re.Match] = None
+    body = []
+    start = end = offset = 0
+    has_content = False
+    chapter = ("", "")
+    chapter_title_pending = False
 
-    current_chunk = ""
-    for line in lines:
-        line = line.strip()
+    for raw in lines:
+        line_start = offset
+        offset += len(raw)
+        line = raw.decode("utf-8").strip()
         if not line:
             continue
 
-        if line.startswith("IPC Section"):
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = line
+        heading = CHAPTER_PATTERN.match(line)
+        header = SECTION_PATTERN.match(line)
+        if heading:
+            if has_content:
+                yield _make_section(match, body, start, end, chapter)
+            match = None
+            body = []
+            has_content = False
+            chapter = (heading.group("numeral"), heading.group("title").strip())
+            chapter_title_pending = not chapter[1]
+        elif chapter_title_pending and not header and not has_content:
+            chapter = (chapter[0], line)
+            chapter_title_pending = False
+        elif header:
+            if has_content:
+                yield _make_section(match, body, start, end, chapter)
+            match = header
+            body = []
+            start = line_start
+            has_content = True
+            chapter_title_pending = False
         else:
-            current_chunk += " " + line
+            if not has_content:
+                start = line_start
+                has_content = True
+            body.append(line)
+        end = offset
 
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    if has_content:
+        yield _make_section(match, body, start, end, chapter)
 
-    return chunks
 
+def _make_section(match: Optional[re.Match], body: list, start: int, end: int,
+                  chapter: Tuple[str, str] = ("", "")) -> Section:
+    if match is None:
+        return Section("", "", "", "", " ".join(body), start, end, *chapter)
+    return Section(
+        act=match.group("act"),
+        number=match.group("number"),
+        title=match.group("title").strip(),
+        header=match.group(0),
+        body=" ".join(body),
+        start=start,
+        end=end,
+        chapter=chapter[0],
+        chapter_title=chapter[1],
+    )
 
-if __name__ == "__main__":
-    data = load_legal_data("data/ipc.txt")
-    chunks = chunk_by_section(data)
 
-    print(f"Total Chunks Created: {len(chunks)}\n")
+def iter_sections(path) -> Iterator[Section]:
+    with open(path, "rb") as file:
+        yield from _iter_sections(file)
+
 
-    for i, chunk in enumerate(chunks):
-        print(f"--- Chunk {i + 1} ---")
-        print(chunk)
+def iter_chunks(path) -> Iterator[str]:
+    for section in iter_sections(path):
+        yield section.text
+
+
+def iter_records(path) -> Iterator[Tuple[str, dict]]:
+    # (text, metadata) pairs for vector_store.build_index.
+    for section in iter_sections(path):
+        yield section.text, section_metadata(section)
+
+
+def chunk_by_section(text):
+    return [section.text for section in _iter_sections(io.BytesIO(text.encode("utf-8")))]
+
+
+if __name__ == "__main__":
+    total = 0
+    for i, section in enumerate(iter_sections("data/ipc.txt")):
+        total += 1
+        print(f"--- Chunk {i + 1} (bytes {section.start}-{section.end}) ---")
+        print(section.text)
         print()
+
+    print(f"Total Chunks Created: {total}")
@@ -0,0 +1,140 @@
+import queue
+import threading
+from typing import Callable, List
+
+from retrieval import estimate_tokens
+
+# ================= CONFIG =================
+# Once the turns not yet covered by the rolling summary pass
+# SUMMARY_TRIGGER_TOKENS, everything except the last KEEP_RECENT_TURNS
+# messages is folded into the summary by a background thread. The history
+# placed in a prompt never exceeds HISTORY_TOKEN_BUDGET.
+SUMMARY_TRIGGER_TOKENS = 400
+KEEP_RECENT_TURNS = 2
+HISTORY_TOKEN_BUDGET = 500
+
+
+def format_turns(turns: List[dict]) -> str:
+    lines = []
+    for item in turns:
+        role = item.get("role", "user")
+        content = item.get("content", "")
+        lines.append(f"{role.capitalize()}: {content}")
+    return "\n".join(lines)
+
+
+def trim_to_tokens(text: str, budget: int, keep_end: bool = True) -> str:
+    # Drops whole lines (oldest first when keep_end) and finally words until
+    # the estimate fits.
+    if estimate_tokens(text) <= budget:
+        return text
+    lines = text.split("\n")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0 if keep_end else -1)
+    words = "\n".join(lines).split(" ")
+    while words and estimate_tokens(" ".join(words)) > budget:
+        words.pop(0 if keep_end else -1)
+    return " ".join(words)
+
+
+def unsummarized(store, session_id: str) -> List[dict]:
+    _, covered = store.summary(session_id)
+    return [turn for turn in store.history(session_id) if turn.get("seq", 0) > covered]
+
+
+def messages_tokens(messages: List[dict]) -> int:
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+def fit_messages(messages: List[dict], budget: int) -> List[dict]:
+    # Drops the oldest messages first; a single message that is still too
+    # long keeps only its end.
+    messages = list(messages)
+    while len(messages) > 1 and messages_tokens(messages) > budget:
+        messages.pop(0)
+    if messages and messages_tokens(messages) > budget:
+        last = messages[-1]
+        messages[-1] = {"role": last["role"], "content": trim_to_tokens(last["content"], max(0, budget - 4))}
+    return messages
+
+
+def history_messages(store, session_id: str, max_turns: int, budget: int = HISTORY_TOKEN_BUDGET) -> List[dict]:
+    # Role-tagged turns not covered by the rolling summary, preceded by the
+    # summary as a system message. Recent turns win when both do not fit.
+    summary, covered = store.summary(session_id)
+    turns = [
+        {"role": t["role"], "content": t["content"]}
+        for t in store.history(session_id, max_turns) if t.get("seq", 0) > covered
+    ]
+    messages = fit_messages(turns, budget) if turns else []
+    remaining = budget - messages_tokens(messages) - 12
+    if summary and remaining > 0:
+        summary = trim_to_tokens(summary, remaining, keep_end=False)
+        if summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of earlier conversation: {summary}"})
+    return messages
+
+
+class ConversationSummarizer:
+    # summarize_fn(previous_summary, turns_text) -> new summary. Jobs run on one
+    # worker thread, so at most one LLM summarization is in flight and
+    # requests never wait for it.
+    def __init__(self, store, summarize_fn: Callable[[str, str], str],
+                 trigger_tokens: int = SUMMARY_TRIGGER_TOKENS,
+                 keep_recent: int = KEEP_RECENT_TURNS) -> None:
+        self.store = store
+        self.summarize_fn = summarize_fn
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = keep_recent
+        self.runs = 0
+        self.failures = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="history-summarizer", daemon=True)
+        self._worker.start()
+
+    def maybe_schedule(self, session_id: str) -> bool:
+        turns = unsummarized(self.store, session_id)
+        if len(turns) <= self.keep_recent:
+            return False
+        if estimate_tokens(format_turns(turns)) < self.trigger_tokens:
+            return False
+        with self._lock:
+            if session_id in self._pending:
+                return False
+            self._pending.add(session_id)
+        self._queue.put(session_id)
+        return True
+
+    def summarize_now(self, session_id: str) -> None:
+        turns = unsummarized(self.store, session_id)
+        older = turns[:-self.keep_recent] if self.keep_recent else turns
+        if not older:
+            return
+        previous, _ = self.store.summary(session_id)
+        summary = self.summarize_fn(previous, format_turns(older)).strip()
+        if summary:
+            self.store.set_summary(session_id, summary, older[-1]["seq"])
+            self.runs += 1
+
+    def _run(self) -> None:
+        while True:
+            session_id = self._queue.get()
+            try:
+                self.summarize_now(session_id)
+            except Exception:
+                self.failures += 1
+            finally:
+                with self._lock:
+                    self._pending.discard(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "trigger_tokens": self.trigger_tokens,
+            "runs": self.runs,
+            "failures": self.failures,
+            "pending": pending,
+        }
@@ -0,0 +1,180 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# ================= CONFIG =================
+# Metadata stored with every section: act, section number, chapter, section
+# type ("definition", "punishment" or "other") and the offence it names.
+# Retrieval filters on these fields with Chroma-style `where` clauses, and
+# definitions are linked to their punishment sections (IPC 378 <-> 379).
+SECTION_TYPES = ("definition", "punishment", "other")
+FILTER_FIELDS = ("act", "chapter", "section", "type")
+
+# Used when the source text has no CHAPTER headings: (first section, numeral, title).
+IPC_CHAPTERS = [
+    ("1", "I", "Introduction"),
+    ("6", "II", "General Explanations"),
+    ("53", "III", "Of Punishments"),
+    ("76", "IV", "General Exceptions"),
+    ("107", "V", "Of Abetment"),
+    ("120A", "VA", "Criminal Conspiracy"),
+    ("121", "VI", "Of Offences against the State"),
+    ("131", "VII", "Of Offences relating to the Army, Navy and Air Force"),
+    ("141", "VIII", "Of Offences against the Public Tranquillity"),
+    ("161", "IX", "Of Offences by or relating to Public Servants"),
+    ("171A", "IXA", "Of Offences relating to Elections"),
+    ("172", "X", "Of Contempts of the Lawful Authority of Public Servants"),
+    ("191", "XI", "Of False Evidence and Offences against Public Justice"),
+    ("230", "XII", "Of Offences relating to Coin and Government Stamps"),
+    ("264", "XIII", "Of Offences relating to Weights and Measures"),
+    ("268", "XIV", "Of Offences affecting the Public Health, Safety, Convenience, Decency and Morals"),
+    ("295", "XV", "Of Offences relating to Religion"),
+    ("299", "XVI", "Of Offences affecting the Human Body"),
+    ("378", "XVII", "Of Offences against Property"),
+    ("463", "XVIII", "Of Offences relating to Documents and to Property Marks"),
+    ("490", "XIX", "Of the Criminal Breach of Contracts of Service"),
+    ("493", "XX", "Of Offences relating to Marriage"),
+    ("498A", "XXA", "Of Cruelty by Husband or Relatives of Husband"),
+    ("499", "XXI", "Of Defamation"),
+    ("503", "XXII", "Of Criminal Intimidation, Insult and Annoyance"),
+    ("511", "XXIII", "Of Attempts to Commit Offences"),
+]
+
+_NUMBER = re.compile(r"^(\d+)([A-Za-z]*)$")
+_PUNISHMENT = re.compile(r"^punishment (?:for|of) (?:the )?(?P<offence>[a-z ,'-]+?)(?: is\b| shall\b|[.:;,]|$)")
+_DEFINED = re.compile(r"^(?:the )?(?P<offence>[a-z ,'-]+?) (?:is defined as|means)\b")
+_SAID_TO_COMMIT = re.compile(r"is said to commit (?:the offence of )?[\"'“]?(?P<offence>[a-z ,'-]+?)[\"'”.,]")
+
+
+def section_key(number: str) -> Tuple[int, str]:
+    match = _NUMBER.match(number or "")
+    if match is None:
+        return (-1, "")
+    return (int(match.group(1)), match.group(2).upper())
+
+
+def ipc_chapter(number: str) -> Tuple[str, str]:
+    key = section_key(number)
+    found = ("", "")
+    for start, numeral, title in IPC_CHAPTERS:
+        if section_key(start) > key:
+            break
+        found = (numeral, title)
+    return found if key[0] >= 0 else ("", "")
+
+
+def classify_section(title: str, body: str) -> Tuple[str, str]:
+    # Returns (type, offence name). The header title is checked before the body.
+    for text in (title, body):
+        text = text.lower().strip()
+        match = _PUNISHMENT.match(text)
+        if match:
+            return "punishment", match.group("offence").strip()
+    for text in (title, body):
+        text = text.lower().strip()
+        match = _DEFINED.match(text) or _SAID_TO_COMMIT.search(text)
+        if match:
+            return "definition", match.group("offence").strip()
+    if "shall be punished" in body.lower():
+        return "punishment", ""
+    return "other", ""
+
+
+def section_metadata(section) -> dict:
+    # section is a chunking.Section. Chroma metadata values must not be None.
+    kind, offence = classify_section(section.title, section.body)
+    chapter, chapter_title = section.chapter, section.chapter_title
+    if not chapter and section.act.upper() == "IPC":
+        chapter, chapter_title = ipc_chapter(section.number)
+    return {
+        "act": section.act.upper(),
+        "section": section.number.upper(),
+        "chapter": chapter,
+        "chapter_title": chapter_title,
+        "type": kind,
+        "offence": offence,
+    }
+
+
+def link_sections(records: List[Tuple[str, dict]]) -> Dict[str, List[str]]:
+    # records: (section id, metadata). Punishment sections are linked to the
+    # definition of the same offence in the same act (or of the longest offence
+    # name their own starts with), or failing that to the definition directly
+    # before them (e.g. 378 -> 379). Links go both ways.
+    definitions = defaultdict(list)
+    by_number = {}
+    for cid, meta in records:
+        if meta.get("type") == "definition":
+            by_number[(meta.get("act"), section_key(meta.get("section", "")))] = cid
+            if meta.get("offence"):
+                definitions[(meta.get("act"), meta["offence"])].append(cid)
+
+    links: Dict[str, List[str]] = defaultdict(list)
+    for cid, meta in records:
+        if meta.get("type") != "punishment":
+            continue
+        act = meta.get("act")
+        offence = meta.get("offence")
+        targets = definitions.get((act, offence), []) if offence else []
+        if offence and not targets:
+            # "culpable homicide not amounting to murder" -> "culpable homicide"
+            prefixes = [name for a, name in definitions if a == act and offence.startswith(name + " ")]
+            targets = definitions[(act, max(prefixes, key=len))] if prefixes else []
+        if not targets:
+            number, suffix = section_key(meta.get("section", ""))
+            previous = by_number.get((act, (number - 1, ""))) if not suffix else by_number.get((act, (number, "")))
+            targets = [previous] if previous else []
+        for target in targets:
+            if target not in links[cid]:
+                links[cid].append(target)
+            if cid not in links[target]:
+                links[target].append(cid)
+    return dict(links)
+
+
+# ================= FILTERS =================
+def where_filter(**fields) -> Optional[dict]:
+    # where_filter(act="IPC", type="punishment") -> Chroma `where` clause; a
+    # list value matches any of its items. Unknown or empty fields are ignored.
+    clauses = []
+    for field in FILTER_FIELDS:
+        value = fields.get(field)
+        if value in (None, "", []):
+            continue
+        if isinstance(value, (list, tuple)):
+            values = [str(v).upper() if field != "type" else str(v).lower() for v in value]
+            clauses.append({field: {"$in": values}})
+        else:
+            clauses.append({field: str(value).upper() if field != "type" else str(value).lower()})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def matches_where(metadata: Optional[dict], where: Optional[dict]) -> bool:
+    # The subset of Chroma's metadata filter syntax that where_filter() emits,
+    # plus $ne/$nin/$or, for backends that filter in Python.
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
@@ -0,0 +1,102 @@
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from chunking import ACTS, SECTION_PATTERN
+from legal_metadata import matches_where
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Longest act first, so the optional "s" of "section" cannot split "BNSS" into BNS + s.
+CITATION_PATTERN = re.compile(
+    r"\b(?:(?P<act>" + "|".join(sorted(ACTS, key=len, reverse=True)) + r")\s*(?:section|sec|s)?|section|sec)\.?\s*(?P<number>\d+[a-z]?)\b",
+    re.IGNORECASE
+)
+FILTER_CACHE_SIZE = 64
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "i", "in", "is", "it",
+    "me", "my", "of", "on", "or", "the", "to", "was", "what", "which", "who", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LexicalIndex:
+    # In-memory BM25 inverted index over the collection's documents, plus a
+    # section-number table for direct citation lookups. `allowed` restricts
+    # results to the document indexes returned by matching(where).
+    def __init__(self, ids: List[str], documents: List[str], k1: float = 1.5, b: float = 0.75,
+                 metadatas: Optional[List[Optional[dict]]] = None) -> None:
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas or [None] * len(documents)
+        self._filters: Dict[str, Set[int]] = {}
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        self.sections: Dict[str, List[int]] = defaultdict(list)
+
+        for idx, document in enumerate(documents):
+            terms = Counter(tokenize(document))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((idx, tf))
+            match = SECTION_PATTERN.match(document)
+            if match:
+                self.sections[match.group("number").lower()].append(idx)
+
+        count = len(documents)
+        self.avg_length = sum(self.doc_lengths) / count if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    @classmethod
+    def from_collection(cls, collection) -> "LexicalIndex":
+        data = collection.get(include=["documents", "metadatas"])
+        return cls(data["ids"], data["documents"], metadatas=data["metadatas"])
+
+    def matching(self, where: Optional[dict]) -> Optional[Set[int]]:
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        allowed = self._filters.get(key)
+        if allowed is None:
+            allowed = {idx for idx, meta in enumerate(self.metadatas) if matches_where(meta, where)}
+            if len(self._filters) >= FILTER_CACHE_SIZE:
+                self._filters.clear()
+            self._filters[key] = allowed
+        return allowed
+
+    def search(self, query: str, k: int = 10, allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for idx, tf in self.postings[term]:
+                if allowed is not None and idx not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[idx] / (self.avg_length or 1.0))
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def lookup(self, query: str, allowed: Optional[Set[int]] = None) -> Optional[List[int]]:
+        # Returns document indexes for explicit citations such as "IPC 420" or
+        # "section 379"; None when the query does not cite a known section.
+        found = []
+        for match in CITATION_PATTERN.finditer(query):
+            act = (match.group("act") or "").lower()
+            for idx in self.sections.get(match.group("number").lower(), []):
+                if act and not self.documents[idx].lower().startswith(act + " "):
+                    continue
+                if allowed is not None and idx not in allowed:
+                    continue
+                if idx not in found:
+                    found.append(idx)
+        return found or None
@@ -0,0 +1,315 @@
+import asyncio
+import json
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional
+
+import httpx
+
+# ================= CONFIG =================
+# CONNECT_TIMEOUT and READ_TIMEOUT apply per request / per streamed chunk; a
+# whole reply must finish within DEADLINE_SECONDS. Connection failures are
+# retried RETRIES times before any token was received. After
+# BREAKER_THRESHOLD failures in a row the client fails fast for
+# BREAKER_RESET_SECONDS instead of piling more requests onto a dead server.
+CONNECT_TIMEOUT = 3.0
+READ_TIMEOUT = 60.0
+DEADLINE_SECONDS = 180.0
+RETRIES = 2
+RETRY_BACKOFF_SECONDS = 0.25
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+MAX_CONNECTIONS = 16
+# Shown by the apps while the circuit breaker is open.
+LLM_UNAVAILABLE = "The language model is not responding right now. Please retry in a minute."
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+class CircuitOpen(LLMError):
+    pass
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, text: str) -> None:
+        super().__init__(f"HTTP {status}: {text}")
+        self.status = status
+        self.text = text
+
+
+def _is_gpu_error(text: str) -> bool:
+    text = text.lower()
+    return "cuda" in text or "gpu" in text
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS) -> None:
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        # After reset_seconds one trial request is let through (half-open);
+        # its outcome closes the breaker or restarts the wait.
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                raise CircuitOpen("LLM server marked unavailable")
+            self.opened_at = time.monotonic()
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        return "closed" if self.opened_at is None else "open"
+
+
+# ================= BACKENDS =================
+# A backend turns messages/options into an HTTP request and parses one line
+# of the streamed reply into (token, done).
+class OllamaBackend:
+    name = "ollama"
+    default_host = "http://127.0.0.1:11434"
+    supports_gpu_fallback = True
+
+    def request(self, model: str, messages: list, options: dict, keep_alive: Optional[str]) -> tuple:
+        body = {"model": model, "messages": messages, "stream": True, "options": options}
+        if keep_alive:
+            body["keep_alive"] = keep_alive
+        return "/api/chat", body
+
+    def parse_line(self, line: str) -> tuple:
+        if not line:
+            return "", False
+        data = json.loads(line)
+        try:
+            if data.get("error"):
+                raise _HTTPError(500, data["error"])
+            return data.get("message", {}).get("content", "") or "", bool(data.get("done"))
+        except (AttributeError, KeyError, IndexError, TypeError) as exc:
+            raise LLMError(f"Malformed reply line: {line[:200]}") from exc
+
+
+class LlamaCppBackend:
+    # llama.cpp's llama-server, OpenAI-compatible endpoint. The model and
+    # context size are fixed when the server starts.
+    name = "llamacpp"
+    default_host = "http://127.0.0.1:8080"
+    supports_gpu_fallback = False
+
+    def request(self, model: str, messages: list, options: dict, keep_alive: Optional[str]) -> tuple:
+        body = {"model": model, "messages": messages, "stream": True, "cache_prompt": True}
+        if "num_predict" in options:
+            body["max_tokens"] = options["num_predict"]
+        if "temperature" in options:
+            body["temperature"] = options["temperature"]
+        return "/v1/chat/completions", body
+
+    def parse_line(self, line: str) -> tuple:
+        if not line.startswith("data:"):
+            return "", False
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return "", True
+        data = json.loads(payload)
+        try:
+            if isinstance(data, dict) and data.get("error"):
+                raise _HTTPError(500, json.dumps(data["error"]))
+            choice = data["choices"][0]
+            return choice.get("delta", {}).get("content") or "", choice.get("finish_reason") is not None
+        except (AttributeError, KeyError, IndexError, TypeError) as exc:
+            raise LLMError(f"Malformed reply line: {line[:200]}") from exc
+
+
+LLM_BACKENDS = {
+    "ollama": OllamaBackend,
+    "llamacpp": LlamaCppBackend,
+}
+
+
+# ================= CLIENT =================
+class LLMClient:
+    # One pooled HTTP connection set per process. On a CUDA/GPU error the
+    # request is retried with num_gpu=0 once and CPU mode is remembered in
+    # mode_file, so later requests (and restarts) skip the failing GPU attempt.
+    def __init__(self, backend: str = "ollama", host: Optional[str] = None, model: str = "mistral",
+                 options: Optional[dict] = None, keep_alive: Optional[str] = None,
+                 mode_file: Optional[Path] = None) -> None:
+        if backend not in LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend: {backend}")
+        self.backend = LLM_BACKENDS[backend]()
+        self.host = host or self.backend.default_host
+        self.model = model
+        self.options = dict(options or {})
+        self.keep_alive = keep_alive
+        self.mode_file = mode_file
+        self.breaker = CircuitBreaker()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.cpu_only = self._load_mode() == "cpu"
+        self._timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+        self._limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+        self._http = httpx.Client(base_url=self.host, timeout=self._timeout, limits=self._limits)
+        self._ahttp: Optional[httpx.AsyncClient] = None
+
+    @property
+    def _mode_key(self) -> str:
+        return f"{self.backend.name}|{self.host}|{self.model}"
+
+    def _load_mode(self) -> str:
+        if self.mode_file is None or not self.mode_file.exists():
+            return "auto"
+        try:
+            return json.loads(self.mode_file.read_text()).get(self._mode_key, "auto")
+        except (OSError, ValueError):
+            return "auto"
+
+    def _remember_cpu(self) -> None:
+        self.cpu_only = True
+        if self.mode_file is None:
+            return
+        try:
+            modes = json.loads(self.mode_file.read_text()) if self.mode_file.exists() else {}
+        except (OSError, ValueError):
+            modes = {}
+        modes[self._mode_key] = "cpu"
+        self.mode_file.write_text(json.dumps(modes))
+
+    def _request(self, messages: list, options: dict) -> tuple:
+        merged = {**self.options, **options}
+        if self.cpu_only and self.backend.supports_gpu_fallback:
+            merged["num_gpu"] = 0
+        return self.backend.request(self.model, messages, merged, self.keep_alive)
+
+    def _should_fall_back(self, exc: Exception, started: bool) -> bool:
+        return (
+            isinstance(exc, _HTTPError) and not started and not self.cpu_only
+            and self.backend.supports_gpu_fallback and _is_gpu_error(exc.text)
+        )
+
+    def _failed(self, exc: Exception) -> LLMError:
+        self.errors += 1
+        self.breaker.failure()
+        if isinstance(exc, LLMError):
+            return exc
+        if isinstance(exc, httpx.TimeoutException):
+            return LLMTimeout(str(exc) or "LLM request timed out")
+        return LLMError(str(exc))
+
+    def stream(self, messages: list, **options) -> Iterator[str]:
+        self.breaker.check()
+        self.requests += 1
+        attempt = 0
+        while True:
+            started = False
+            try:
+                for token in self._stream_once(messages, options):
+                    started = True
+                    yield token
+                self.breaker.success()
+                return
+            except (_HTTPError, httpx.HTTPError, LLMError, ValueError) as exc:
+                if self._should_fall_back(exc, started):
+                    self._remember_cpu()
+                    continue
+                if started or attempt >= RETRIES or not isinstance(exc, httpx.TransportError):
+                    raise self._failed(exc) from exc
+                attempt += 1
+                self.retries += 1
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    def _stream_once(self, messages: list, options: dict) -> Iterator[str]:
+        path, body = self._request(messages, options)
+        deadline = time.monotonic() + DEADLINE_SECONDS
+        with self._http.stream("POST", path, json=body) as response:
+            if response.status_code >= 400:
+                raise _HTTPError(response.status_code, response.read().decode("utf-8", "replace"))
+            for line in response.iter_lines():
+                if time.monotonic() > deadline:
+                    raise LLMTimeout(f"No complete reply within {DEADLINE_SECONDS:.0f}s")
+                token, done = self.backend.parse_line(line.strip())
+                if token:
+                    yield token
+                if done:
+                    return
+
+    def chat(self, messages: list, **options) -> str:
+        return "".join(self.stream(messages, **options))
+
+    # ---------- async (used by asgi_app.py) ----------
+    def _async_http(self) -> httpx.AsyncClient:
+        if self._ahttp is None:
+            self._ahttp = httpx.AsyncClient(base_url=self.host, timeout=self._timeout, limits=self._limits)
+        return self._ahttp
+
+    async def astream(self, messages: list, **options) -> AsyncIterator[str]:
+        self.breaker.check()
+        self.requests += 1
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async for token in self._astream_once(messages, options):
+                    started = True
+                    yield token
+                self.breaker.success()
+                return
+            except (_HTTPError, httpx.HTTPError, LLMError, ValueError) as exc:
+                if self._should_fall_back(exc, started):
+                    self._remember_cpu()
+                    continue
+                if started or attempt >= RETRIES or not isinstance(exc, httpx.TransportError):
+                    raise self._failed(exc) from exc
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    async def _astream_once(self, messages: list, options: dict) -> AsyncIterator[str]:
+        path, body = self._request(messages, options)
+        deadline = time.monotonic() + DEADLINE_SECONDS
+        async with self._async_http().stream("POST", path, json=body) as response:
+            if response.status_code >= 400:
+                raise _HTTPError(response.status_code, (await response.aread()).decode("utf-8", "replace"))
+            async for line in response.aiter_lines():
+                if time.monotonic() > deadline:
+                    raise LLMTimeout(f"No complete reply within {DEADLINE_SECONDS:.0f}s")
+                token, done = self.backend.parse_line(line.strip())
+                if token:
+                    yield token
+                if done:
+                    return
+
+    async def achat(self, messages: list, **options) -> str:
+        return "".join([token async for token in self.astream(messages, **options)])
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "host": self.host,
+            "model": self.model,
+            "mode": "cpu" if self.cpu_only else "auto",
+            "circuit": self.breaker.state,
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
@@ -0,0 +1,118 @@
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ================= CONFIG =================
+# A fake LLM server for offline load tests. It speaks the Ollama /api/chat
+# and llama.cpp /v1/chat/completions streaming formats and emits a canned
+# answer at a fixed token rate after a fixed first-token delay.
+HOST = "127.0.0.1"
+PORT = 11435
+TOKENS_PER_SECOND = 30.0
+FIRST_TOKEN_MS = 150
+ANSWER = (
+    "1) Summary: you are describing a possible offence under the Indian Penal Code. "
+    "2) Relevant section: IPC Section 379 covers punishment for theft. "
+    "3) Next steps: note the date, time and place; keep any receipts or photos; "
+    "file an FIR at the nearest police station; ask for a free copy of the FIR. "
+    "4) Clarifying questions: what was taken, and do you know who took it? "
+    "This is for educational purposes only. Consult a licensed lawyer for legal advice."
+)
+
+
+def _tokens(limit: int = 0) -> list:
+    words = ANSWER.split(" ")
+    tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+    return tokens[:limit] if limit else tokens
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    tokens_per_second = TOKENS_PER_SECOND
+    first_token_ms = FIRST_TOKEN_MS
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _start_stream(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _emit(self, tokens: list, render) -> None:
+        time.sleep(self.first_token_ms / 1000.0)
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(delay)
+            self._chunk(render(token))
+
+    def do_GET(self):
+        body = b'{"status": "ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = self._read_json()
+        model = request.get("model", "stub")
+        if self.path == "/api/chat":
+            limit = request.get("options", {}).get("num_predict", 0)
+            self._start_stream("application/x-ndjson")
+            self._emit(_tokens(limit), lambda t: json.dumps(
+                {"model": model, "message": {"role": "assistant", "content": t}, "done": False}) + "\n")
+            self._chunk(json.dumps({"model": model, "message": {"role": "assistant", "content": ""},
+                                    "done": True}) + "\n")
+        elif self.path == "/v1/chat/completions":
+            limit = request.get("max_tokens") or 0
+            self._start_stream("text/event-stream")
+            self._emit(_tokens(limit), lambda t: "data: " + json.dumps(
+                {"choices": [{"index": 0, "delta": {"content": t}, "finish_reason": None}]}) + "\n\n")
+            self._chunk("data: " + json.dumps(
+                {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}) + "\n\n")
+            self._chunk("data: [DONE]\n\n")
+        else:
+            self.send_error(404)
+            return
+        self._chunk("")
+
+
+def serve(host: str = HOST, port: int = PORT, tokens_per_second: float = TOKENS_PER_SECOND,
+          first_token_ms: float = FIRST_TOKEN_MS) -> ThreadingHTTPServer:
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "tokens_per_second": tokens_per_second,
+        "first_token_ms": first_token_ms,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama / llama.cpp server for offline load tests.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--rate", type=float, default=TOKENS_PER_SECOND, help="Tokens per second")
+    parser.add_argument("--first-token-ms", type=float, default=FIRST_TOKEN_MS)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.rate, args.first_token_ms)
+    print(f"LLM stub listening on http://{args.host}:{args.port} ({args.rate:g} tokens/s)")
+    print(f"Point the app at it with LEGAL_LLM_HOST=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
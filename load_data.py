@@ -1,9 +1,9 @@
-def load_legal_data(path):
-    with open(path, "r", encoding="utf-8") as file:
-        return file.read()
+from chunking import iter_sections
 
 
 if __name__ == "__main__":
-    data = load_legal_data("data/ipc.txt")
-    print("Legal Data Loaded Successfully\n")
-    print(data)
+    count = 0
+    for section in iter_sections("data/ipc.txt"):
+        print(section.text)
+        count += 1
+    print(f"\nLegal Data Loaded Successfully ({count} sections)")
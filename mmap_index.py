@@ -0,0 +1,281 @@
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from legal_metadata import matches_where
+
+# ================= CONFIG =================
+# A flat exact-search index with the subset of the Chroma collection API
+# that vector_store.py and retrieval.py use. Embeddings are one matrix
+# (int8 with a per-row scale, float16 or float32) opened with mmap, so worker
+# processes share its pages; section text is one UTF-8 file addressed by an
+# offset table. Metadata is kept as a JSON column; `where` filters select the
+# matching rows before the distance computation. int8 is the default: NumPy widens float16 to float32 far
+# more slowly than int8 for the dot product. Search is a blocked matrix-vector product plus a top-k, with
+# Chroma's default squared-L2 distance.
+#
+# Writes are buffered and saved by persist() into a new generation directory;
+# CURRENT is then switched atomically and readers move to it on their next
+# call. The previous generation is kept so readers still mapping it are safe.
+DTYPES = ("float32", "float16", "int8")
+SEARCH_BLOCK_ROWS = 65536
+MAX_BATCH_SIZE = 100000
+KEEP_GENERATIONS = 2
+FILTER_CACHE_SIZE = 64
+CURRENT_FILE = "CURRENT"
+
+
+class _Generation:
+    # One immutable on-disk snapshot of a collection.
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8")) if path else {}
+        self.count = meta.get("count", 0)
+        self.dim = meta.get("dim", 0)
+        self.dtype = meta.get("dtype", "float32")
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.metadatas: List[Optional[dict]] = []
+        self._filters: Dict[str, np.ndarray] = {}
+        if not self.count:
+            return
+        self.ids = [i.decode("utf-8") for i in np.load(path / "ids.npy").tolist()]
+        self.rows = {cid: row for row, cid in enumerate(self.ids)}
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(path / "scales.npy") if self.dtype == "int8" else None
+        self.sq_norms = np.load(path / "sq_norms.npy")
+        self.offsets = np.load(path / "offsets.npy")
+        self.text = np.memmap(path / "documents.bin", dtype=np.uint8, mode="r")
+        self.metadatas = json.loads((path / "metadatas.json").read_text(encoding="utf-8"))
+
+    def matching(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        # Row numbers passing the filter (None = all rows), cached per filter.
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        rows = self._filters.get(key)
+        if rows is None:
+            rows = np.array([row for row, meta in enumerate(self.metadatas) if matches_where(meta, where)],
+                            dtype=np.int64)
+            if len(self._filters) >= FILTER_CACHE_SIZE:
+                self._filters.clear()
+            self._filters[key] = rows
+        return rows
+
+    def document(self, row: int) -> str:
+        return bytes(self.text[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+
+    def vector(self, row: int) -> np.ndarray:
+        vector = np.asarray(self.vectors[row], dtype=np.float32)
+        return vector * self.scales[row] if self.scales is not None else vector
+
+    def distances(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        # Distances for all rows, or for the given row numbers in that order.
+        count = self.count if rows is None else len(rows)
+        dots = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            if rows is None:
+                block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            else:
+                block = self.vectors[rows[start:start + SEARCH_BLOCK_ROWS]]
+            dots[start:start + len(block)] = np.asarray(block, dtype=np.float32) @ query
+        scales = self.scales if rows is None or self.scales is None else self.scales[rows]
+        norms = self.sq_norms if rows is None else self.sq_norms[rows]
+        if scales is not None:
+            dots *= scales
+        return norms + float(query @ query) - 2.0 * dots
+
+
+def _write_generation(path: Path, ids: List[str], documents: List[str], vectors: np.ndarray,
+                      metadatas: List[Optional[dict]], dtype: str) -> None:
+    path.mkdir(parents=True)
+    count, dim = vectors.shape if len(ids) else (0, 0)
+    if count:
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            stored = np.round(vectors / scales[:, None]).astype(np.int8)
+            np.save(path / "scales.npy", scales.astype(np.float32))
+            restored = stored.astype(np.float32) * scales[:, None]
+        else:
+            stored = vectors.astype(dtype)
+            restored = stored.astype(np.float32)
+        np.save(path / "vectors.npy", stored)
+        np.save(path / "sq_norms.npy", (restored * restored).sum(axis=1).astype(np.float32))
+        np.save(path / "ids.npy", np.array([cid.encode("utf-8") for cid in ids]))
+
+        encoded = [document.encode("utf-8") for document in documents]
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(data) for data in encoded])
+        np.save(path / "offsets.npy", offsets)
+        (path / "documents.bin").write_bytes(b"".join(encoded))
+        (path / "metadatas.json").write_text(json.dumps(metadatas), encoding="utf-8")
+    meta = {"count": count, "dim": int(dim), "dtype": dtype, "created": time.time()}
+    (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+
+class MmapCollection:
+    def __init__(self, path: Path, name: str, dtype: str = "int8") -> None:
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown index dtype: {dtype}")
+        self.path = Path(path)
+        self.name = name
+        self.dtype = dtype
+        self._generation: Optional[_Generation] = None
+        self._generation_name: Optional[str] = None
+        self._pending: Optional[Dict[str, tuple]] = None
+        self._lock = threading.RLock()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    # ---------- reading ----------
+    def _current_name(self) -> str:
+        try:
+            return (self.path / CURRENT_FILE).read_text(encoding="utf-8").strip()
+        except OSError:
+            return ""
+
+    def _view(self) -> _Generation:
+        with self._lock:
+            if self._pending is not None:
+                self.persist()
+            name = self._current_name()
+            if self._generation is None or name != self._generation_name:
+                self._generation = _Generation(self.path / name if name else None)
+                self._generation_name = name
+            return self._generation
+
+    def count(self) -> int:
+        return self._view().count
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None,
+            include: Optional[List[str]] = None) -> dict:
+        include = ["documents", "metadatas"] if include is None else include
+        view = self._view()
+        rows = range(view.count) if ids is None else [view.rows[cid] for cid in ids if cid in view.rows]
+        if where:
+            rows = [row for row in rows if matches_where(view.metadatas[row], where)]
+        result = {"ids": [view.ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [view.document(row) for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [view.metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [view.vector(row) for row in rows]
+        return result
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[dict] = None,
+              include: Optional[List[str]] = None) -> dict:
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        view = self._view()
+        candidates = view.matching(where)
+        size = view.count if candidates is None else len(candidates)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        for embedding in query_embeddings:
+            rows, distances = [], []
+            if size:
+                query = np.asarray(embedding, dtype=np.float32)
+                all_distances = view.distances(query, candidates)
+                k = min(n_results, size)
+                top = np.argpartition(all_distances, k - 1)[:k]
+                top = top[np.argsort(all_distances[top])]
+                distances = [float(all_distances[i]) for i in top]
+                rows = (top if candidates is None else candidates[top]).tolist()
+            result["ids"].append([view.ids[row] for row in rows])
+            result["distances"].append(distances)
+            result["documents"].append([view.document(row) for row in rows] if "documents" in include else None)
+            result["metadatas"].append([view.metadatas[row] for row in rows] if "metadatas" in include else None)
+            result["embeddings"].append([view.vector(row) for row in rows] if "embeddings" in include else None)
+        return result
+
+    # ---------- writing ----------
+    def _rows_for_write(self) -> Dict[str, tuple]:
+        if self._pending is None:
+            view = self._view()
+            self._pending = {
+                cid: (view.document(row), view.vector(row), view.metadatas[row])
+                for row, cid in enumerate(view.ids)
+            }
+        return self._pending
+
+    def upsert(self, ids: List[str], documents: List[str], embeddings: List[List[float]],
+               metadatas: Optional[List[Optional[dict]]] = None) -> None:
+        with self._lock:
+            rows = self._rows_for_write()
+            for i, (cid, document, embedding) in enumerate(zip(ids, documents, embeddings)):
+                rows[cid] = (document, np.asarray(embedding, dtype=np.float32), metadatas[i] if metadatas else None)
+
+    def update(self, ids: List[str], metadatas: List[Optional[dict]]) -> None:
+        with self._lock:
+            rows = self._rows_for_write()
+            for cid, metadata in zip(ids, metadatas):
+                if cid in rows:
+                    rows[cid] = rows[cid][:2] + (metadata,)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            rows = self._rows_for_write()
+            for cid in ids:
+                rows.pop(cid, None)
+
+    def persist(self) -> None:
+        with self._lock:
+            if self._pending is None:
+                return
+            ids = list(self._pending)
+            documents = [self._pending[cid][0] for cid in ids]
+            metadatas = [self._pending[cid][2] for cid in ids]
+            vectors = np.stack([self._pending[cid][1] for cid in ids]) if ids else np.zeros((0, 0), np.float32)
+            name = f"gen-{time.time_ns()}"
+            staging = self.path / f"{name}.tmp"
+            _write_generation(staging, ids, documents, vectors, metadatas, self.dtype)
+            os.replace(staging, self.path / name)
+            pointer = self.path / f"{CURRENT_FILE}.tmp"
+            pointer.write_text(name, encoding="utf-8")
+            os.replace(pointer, self.path / CURRENT_FILE)
+            self._pending = None
+            self._prune(name)
+
+    def _prune(self, current: str) -> None:
+        # Older generations may still be mapped by another process; on Windows
+        # removing them fails and is retried after the next write.
+        generations = sorted(p for p in self.path.iterdir() if p.is_dir() and p.name.startswith("gen-"))
+        keep = {p.name for p in generations if not p.name.endswith(".tmp")}
+        keep = set(sorted(keep)[-KEEP_GENERATIONS:]) | {current}
+        for path in generations:
+            if path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class MmapStore:
+    # Stand-in for chromadb.PersistentClient: one sub-directory per collection.
+    def __init__(self, path: Path, dtype: str = "int8") -> None:
+        self.path = Path(path)
+        self.dtype = dtype
+        self._collections: Dict[str, MmapCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str) -> MmapCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MmapCollection(self.path / name, name, self.dtype)
+            return self._collections[name]
+
+    def get_collection(self, name: str) -> MmapCollection:
+        # Like Chroma, fails for a collection that was never written.
+        if name not in self._collections and not (self.path / name / CURRENT_FILE).exists():
+            raise ValueError(f"Collection {name} does not exist")
+        return self.get_or_create_collection(name)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+            shutil.rmtree(self.path / name, ignore_errors=True)
+
+    def get_max_batch_size(self) -> int:
+        return MAX_BATCH_SIZE
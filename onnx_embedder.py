@@ -0,0 +1,194 @@
+import argparse
+import json
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+# ================= CONFIG =================
+# The sentence-transformers model exported once to ONNX (optionally with
+# dynamic int8 weights) and run through onnxruntime, so serving processes do
+# not import torch. Export needs torch/transformers; serving needs only
+# onnxruntime and tokenizers. An export is accepted only if its vectors agree
+# with the torch model to MIN_AGREEMENT cosine, so an existing chroma_db
+# built with torch stays valid.
+MAX_SEQ_LENGTH = 256
+ONNX_THREADS = 0  # 0 lets onnxruntime pick
+OPSET = 14
+MIN_AGREEMENT = 0.99
+MODEL_FILE = "model.onnx"
+QUANTIZED_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+AGREEMENT_FILE = "agreement.json"
+CHECK_TEXTS = [
+    "Whoever intends to take dishonestly any movable property out of the possession of any person",
+    "punishment for theft",
+    "what is the punishment for murder",
+    "Section 420 cheating and dishonestly inducing delivery of property",
+    "someone stole my phone at the bus stop",
+    "my landlord locked me out and kept my deposit",
+    "Whoever voluntarily causes hurt shall be punished with imprisonment which may extend to one year",
+    "is it a crime to threaten someone over text messages",
+    "Section 498A husband or relative of husband subjecting a woman to cruelty",
+    "defamation",
+]
+
+
+def model_file(quantized: bool) -> str:
+    return QUANTIZED_FILE if quantized else MODEL_FILE
+
+
+class OnnxEmbedder:
+    # Drop-in for SentenceTransformer.encode(): mean pooling over the token
+    # embeddings followed by L2 normalization, as in all-MiniLM-L6-v2's
+    # sentence-transformers pipeline.
+    def __init__(self, model_dir: Path, quantized: bool = False, threads: int = ONNX_THREADS,
+                 max_seq_length: int = MAX_SEQ_LENGTH) -> None:
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        path = model_dir / model_file(quantized)
+        if not path.exists():
+            flag = " --quantize" if quantized else ""
+            raise FileNotFoundError(f"ONNX model not found at {path}; run: python onnx_embedder.py --export{flag}")
+
+        self.quantized = quantized
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+        mask = feeds["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Sorting by length keeps padding inside each batch small.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            index = order[start:start + batch_size]
+            for i, vector in zip(index, self._encode_batch([texts[i] for i in index])):
+                vectors[i] = vector
+        result = np.stack(vectors)
+        return result[0] if single else result
+
+
+# ================= EXPORT / AGREEMENT =================
+def agreement(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = (reference * candidate).sum(axis=1)
+    return {"min_cosine": round(float(cosines.min()), 6), "mean_cosine": round(float(cosines.mean()), 6)}
+
+
+def read_agreement(model_dir: Path) -> dict:
+    try:
+        return json.loads((Path(model_dir) / AGREEMENT_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def check_agreement(model_dir: Path, quantized: bool, reference_model, texts: Optional[List[str]] = None) -> dict:
+    texts = texts or CHECK_TEXTS
+    reference = np.asarray(reference_model.encode(texts, show_progress_bar=False), dtype=np.float32)
+    candidate = OnnxEmbedder(model_dir, quantized=quantized).encode(texts)
+    result = agreement(reference, candidate)
+    result["passed"] = result["min_cosine"] >= MIN_AGREEMENT
+
+    report = read_agreement(model_dir)
+    report[model_file(quantized)] = result
+    (Path(model_dir) / AGREEMENT_FILE).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return result
+
+
+def export(model_name: str, model_dir: Path, quantize: bool = False) -> dict:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    reference = SentenceTransformer(model_name, device="cpu")
+    transformer = reference[0].auto_model.eval()
+    reference.tokenizer.save_pretrained(str(model_dir))
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, model) -> None:
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    sample = reference.tokenizer(CHECK_TEXTS[:2], padding=True, return_tensors="pt")
+    dynamic = {0: "batch", 1: "tokens"}
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(transformer),
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            str(model_dir / MODEL_FILE),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "token_type_ids": dynamic,
+                          "last_hidden_state": dynamic},
+            opset_version=OPSET
+        )
+    results = {MODEL_FILE: check_agreement(model_dir, False, reference)}
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(model_dir / MODEL_FILE), str(model_dir / QUANTIZED_FILE), weight_type=QuantType.QInt8)
+        results[QUANTIZED_FILE] = check_agreement(model_dir, True, reference)
+    return results
+
+
+def main() -> None:
+    from runtime import EMBED_MODEL, ONNX_DIR
+
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX and check it against torch.")
+    parser.add_argument("--export", action="store_true", help="Export the model (needs torch)")
+    parser.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 model")
+    parser.add_argument("--check", action="store_true", help="Re-run the cosine agreement check (needs torch)")
+    args = parser.parse_args()
+
+    if args.export:
+        results = export(EMBED_MODEL, ONNX_DIR, quantize=args.quantize)
+    elif args.check:
+        from sentence_transformers import SentenceTransformer
+        reference = SentenceTransformer(EMBED_MODEL, device="cpu")
+        results = {}
+        for quantized in (False, True):
+            if (ONNX_DIR / model_file(quantized)).exists():
+                results[model_file(quantized)] = check_agreement(ONNX_DIR, quantized, reference)
+    else:
+        results = read_agreement(ONNX_DIR)
+
+    if not results:
+        print(f"No ONNX export in {ONNX_DIR}; run with --export [--quantize]")
+    for name, result in results.items():
+        status = "ok" if result["passed"] else f"FAILED (< {MIN_AGREEMENT})"
+        print(f"{name}: min cosine {result['min_cosine']:.4f}, mean {result['mean_cosine']:.4f} - {status}")
+
+
+if __name__ == "__main__":
+    main()
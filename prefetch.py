@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from embedding_cache import normalize_query
+
+
+class RetrievalPrefetcher:
+    # Runs fetch_fn(query) in the background for a query that is probably
+    # about to be asked (typed text, stable partial transcript). Each owner
+    # (browser session, voice loop) keeps only its latest prefetch; take()
+    # returns it when the final query normalizes to the same text.
+    def __init__(self, fetch_fn: Callable[[str], object], workers: int = 2, maxsize: int = 256,
+                 ttl_seconds: float = 120.0) -> None:
+        self.fetch_fn = fetch_fn
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.submitted = 0
+        self.hits = 0
+        self.misses = 0
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def submit(self, owner: str, query: str) -> bool:
+        key = normalize_query(query)
+        if not key:
+            return False
+        with self._lock:
+            current = self._pending.get(owner)
+            if current is not None:
+                if current[0] == key:
+                    return False
+                current[1].cancel()
+            future: Future = self._pool.submit(self.fetch_fn, query)
+            self._pending[owner] = (key, future, time.monotonic())
+            self._pending.move_to_end(owner)
+            while len(self._pending) > self.maxsize:
+                self._pending.popitem(last=False)
+            self.submitted += 1
+        return True
+
+    def take(self, owner: str, query: str) -> Optional[object]:
+        with self._lock:
+            entry = self._pending.pop(owner, None)
+        if entry is None:
+            return None
+        key, future, created = entry
+        if key != normalize_query(query) or time.monotonic() - created > self.ttl_seconds:
+            future.cancel()
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            result = future.result()
+        except Exception:
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "submitted": self.submitted,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
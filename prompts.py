@@ -0,0 +1,61 @@
+from typing import List
+
+from conversation import fit_messages, messages_tokens
+from retrieval import format_context, section_list
+
+DISCLAIMER = "This is for educational purposes only. Consult a licensed lawyer for legal advice."
+
+# Hard cap on the whole prompt. Sections are already packed to
+# CONTEXT_TOKEN_BUDGET, so only the conversation history is trimmed here.
+PROMPT_TOKEN_BUDGET = 1500
+
+# Sent unchanged as the first message of every chat, so Ollama can reuse its
+# KV cache instead of re-reading the instructions on each request. Anything
+# that varies per request goes in later messages.
+SYSTEM_PROMPT = f"""You are an Indian legal assistant.
+Use ONLY the context given with each question.
+You MUST mention the IPC Section number(s) you rely on.
+Your job is to help the user understand their situation and guide them with next steps.
+If details are missing, ask 3 short clarification questions first.
+Keep the response simple, structured, and practical.
+Do NOT include unrelated policy text or boilerplate.
+
+Format:
+1) Summary of the situation in 1-2 lines.
+2) Relevant IPC section(s).
+3) What the user can do next (3-5 bullet steps).
+4) Clarifying questions (if needed).
+5) End with the exact disclaimer sentence.
+
+End every answer with exactly:
+{DISCLAIMER}"""
+
+
+def build_messages(sections: List[dict], history: List[dict], query: str) -> List[dict]:
+    system = {"role": "system", "content": SYSTEM_PROMPT}
+    question = {"role": "user", "content": f"""Sections provided: {section_list(sections)}
+
+Context:
+{format_context(sections)}
+
+Question:
+{query}"""}
+    budget = PROMPT_TOKEN_BUDGET - messages_tokens([system, question])
+    history = fit_messages(history, budget) if history and budget > 0 else []
+    return [system, *history, question]
+
+
+def build_summary_prompt(previous: str, turns: str) -> str:
+    return f"""
+Update the running summary of a conversation between a user and an Indian legal assistant.
+Keep the user's situation, facts they gave, IPC sections discussed and advice already given.
+Drop greetings, disclaimers and repeated formatting. Write at most 120 words of plain text.
+
+Current summary:
+{previous or "(none)"}
+
+New conversation turns:
+{turns}
+
+Updated summary:
+"""
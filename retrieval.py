@@ -0,0 +1,262 @@
+import math
+import threading
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from chunking import SECTION_PATTERN
+from lexical_index import LexicalIndex
+from vector_store import collection_dir, read_index_version, read_section_links
+
+# ================= CONFIG =================
+TOP_K = 4
+FETCH_K = 12
+MMR_LAMBDA = 0.7
+DUPLICATE_THRESHOLD = 0.97
+CONTEXT_TOKEN_BUDGET = 700
+RRF_K = 60
+LINKED_PER_SECTION = 2
+
+_lexical_lock = threading.Lock()
+_lexical_indexes = {}
+_section_links = {}
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough word-piece estimate; good enough to keep prompt size bounded.
+    return int(len(text.split()) * 1.3) + 1
+
+
+def section_label(document: str) -> str:
+    match = SECTION_PATTERN.match(document)
+    if match is None:
+        return ""
+    return f"{match.group('act')} Section {match.group('number')}"
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def mmr(query_embedding: Sequence[float], candidates: List[Sequence[float]], k: int,
+        lambda_: float = MMR_LAMBDA, relevance: Optional[List[float]] = None) -> List[int]:
+    # Maximal marginal relevance: trade similarity to the query against
+    # similarity to what is already picked. Candidates that are almost
+    # identical to a picked one are dropped outright.
+    if relevance is None:
+        relevance = [_cosine(query_embedding, c) for c in candidates]
+    picked: List[int] = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(picked) < k:
+        best, best_score = None, -math.inf
+        for i in list(remaining):
+            redundancy = max((_cosine(candidates[i], candidates[j]) for j in picked), default=0.0)
+            if redundancy >= DUPLICATE_THRESHOLD:
+                remaining.remove(i)
+                continue
+            score = lambda_ * relevance[i] - (1 - lambda_) * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        if best is None:
+            break
+        picked.append(best)
+        remaining.remove(best)
+    return picked
+
+
+def pack_sections(sections: List[dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[dict]:
+    packed = []
+    used = 0
+    for section in sections:
+        cost = estimate_tokens(section["document"])
+        if packed and used + cost > token_budget:
+            continue
+        if not packed and cost > token_budget:
+            words = section["document"].split()
+            section = dict(section, document=" ".join(words[:int(token_budget / 1.3)]))
+            cost = token_budget
+        packed.append(section)
+        used += cost
+    return packed
+
+
+def get_lexical_index(collection) -> LexicalIndex:
+    # Built from the collection on first use and rebuilt after each ingest.
+    key = (collection.name, read_index_version(collection_dir(collection.name)))
+    index = _lexical_indexes.get(key)
+    if index is None:
+        with _lexical_lock:
+            index = _lexical_indexes.get(key)
+            if index is None:
+                index = LexicalIndex.from_collection(collection)
+                for old in [k for k in _lexical_indexes if k[0] == collection.name]:
+                    del _lexical_indexes[old]
+                _lexical_indexes[key] = index
+    return index
+
+
+def get_section_links(name: str) -> dict:
+    # Definition <-> punishment links written by ingest; reloaded after each ingest.
+    key = (name, read_index_version(collection_dir(name)))
+    links = _section_links.get(key)
+    if links is None:
+        links = read_section_links(collection_dir(name))
+        for old in [k for k in _section_links if k[0] == name]:
+            del _section_links[old]
+        _section_links[key] = links
+    return links
+
+
+def with_linked_sections(sections: List[dict], collection, where: Optional[dict] = None) -> List[dict]:
+    # Places each retrieved definition's punishment sections (and the reverse),
+    # at most LINKED_PER_SECTION, right after it unless already in the results
+    # or failing `where`.
+    links = get_section_links(collection.name)
+    have = {section["id"] for section in sections}
+    wanted = []
+    for section in sections:
+        for cid in links.get(section["id"], [])[:LINKED_PER_SECTION]:
+            if cid not in have:
+                have.add(cid)
+                wanted.append(cid)
+    if not wanted:
+        return sections
+
+    found = collection.get(ids=wanted, where=where, include=["documents"])
+    documents = dict(zip(found["ids"], found["documents"]))
+    joined = []
+    for section in sections:
+        joined.append(section)
+        for cid in links.get(section["id"], []):
+            if cid in documents:
+                joined.append(_section(cid, documents.pop(cid), section["distance"]))
+    return joined
+
+
+def _section(section_id: str, document: str, distance: float) -> dict:
+    return {
+        "id": section_id,
+        "document": document,
+        "distance": distance,
+        "label": section_label(document),
+    }
+
+
+def cited_sections(query: str, collection, where: Optional[dict] = None) -> List[dict]:
+    index = get_lexical_index(collection)
+    found = index.lookup(query, index.matching(where))
+    if not found:
+        return []
+    sections = [_section(index.ids[i], index.documents[i], 0.0) for i in found]
+    return with_linked_sections(sections, collection, where)
+
+
+def exact_sections(query: str, collection, where: Optional[dict] = None) -> List[dict]:
+    return pack_sections(cited_sections(query, collection, where))
+
+
+def gather_candidates(query_embedding: Sequence[float], collection, query: Optional[str] = None,
+                      fetch_k: int = FETCH_K, where: Optional[dict] = None) -> List[dict]:
+    # Nearest neighbours plus BM25 hits of one collection. "vector" marks the
+    # nearest-neighbour results; "lexical_rank" is the BM25 rank (or None).
+    # where is a metadata pre-filter (see legal_metadata.where_filter); only
+    # matching sections are searched.
+    res = collection.query(
+        query_embeddings=[list(query_embedding)],
+        n_results=fetch_k,
+        where=where,
+        include=["documents", "distances", "embeddings"]
+    )
+    candidates = {}
+    for cid, document, distance, embedding in zip(
+        res["ids"][0], res["documents"][0], res["distances"][0], res["embeddings"][0]
+    ):
+        candidates[cid] = {
+            "id": cid,
+            "document": document,
+            "distance": float(distance),
+            "embedding": [float(x) for x in embedding],
+            "vector": True,
+            "lexical_rank": None,
+        }
+
+    if query:
+        index = get_lexical_index(collection)
+        hits = index.search(query, fetch_k, index.matching(where))
+        missing = []
+        for rank, (idx, _) in enumerate(hits, start=1):
+            cid = index.ids[idx]
+            if cid in candidates:
+                candidates[cid]["lexical_rank"] = rank
+            else:
+                missing.append((cid, rank))
+        if missing:
+            ranks = dict(missing)
+            extra = collection.get(ids=list(ranks), include=["documents", "embeddings"])
+            for cid, document, embedding in zip(extra["ids"], extra["documents"], extra["embeddings"]):
+                embedding = [float(x) for x in embedding]
+                candidates[cid] = {
+                    "id": cid,
+                    "document": document,
+                    # Chroma's default squared-L2 distance on unit-length vectors.
+                    "distance": 2.0 * (1.0 - _cosine(query_embedding, embedding)),
+                    "embedding": embedding,
+                    "vector": False,
+                    "lexical_rank": ranks[cid],
+                }
+    return list(candidates.values())
+
+
+def rank_candidates(query_embedding: Sequence[float], candidates: List[dict], top_k: int = TOP_K,
+                    fetch_k: int = FETCH_K, lambda_: float = MMR_LAMBDA) -> List[dict]:
+    # Reciprocal rank fusion of vector distance and BM25 rank, so exact legal
+    # terms can outrank loosely similar sections, then MMR. Candidates may come
+    # from several collections: the vector rank is recomputed over all of them.
+    vector = sorted((c for c in candidates if c["vector"]), key=lambda c: c["distance"])
+    fused = {c["id"]: 1.0 / (RRF_K + rank) for rank, c in enumerate(vector, start=1)}
+    for c in sorted((c for c in candidates if c["lexical_rank"] is not None), key=lambda c: c["lexical_rank"]):
+        fused[c["id"]] = fused.get(c["id"], 0.0) + 1.0 / (RRF_K + c["lexical_rank"])
+
+    by_id = {c["id"]: c for c in candidates}
+    ranked = sorted(fused, key=fused.get, reverse=True)[:max(top_k, fetch_k)]
+    top_score = fused[ranked[0]] if ranked else 1.0
+    order = mmr(
+        query_embedding,
+        [by_id[cid]["embedding"] for cid in ranked],
+        top_k,
+        lambda_,
+        relevance=[fused[cid] / top_score for cid in ranked]
+    )
+    return [_section(ranked[i], by_id[ranked[i]]["document"], by_id[ranked[i]]["distance"]) for i in order]
+
+
+def retrieve(query_embedding: Sequence[float], collection, query: Optional[str] = None,
+             top_k: int = TOP_K, fetch_k: int = FETCH_K, lambda_: float = MMR_LAMBDA,
+             token_budget: int = CONTEXT_TOKEN_BUDGET, where: Optional[dict] = None) -> List[dict]:
+    candidates = gather_candidates(query_embedding, collection, query, max(top_k, fetch_k), where)
+    sections = rank_candidates(query_embedding, candidates, top_k, fetch_k, lambda_)
+    return pack_sections(with_linked_sections(sections, collection, where), token_budget)
+
+
+def search_sections(query: str, collection, encode: Callable[[str], List[float]],
+                    where: Optional[dict] = None) -> Tuple[List[dict], Optional[List[float]]]:
+    # Explicit citations ("IPC 420", "section 379") skip embedding and ANN
+    # search entirely; the embedding is None in that case.
+    sections = exact_sections(query, collection, where)
+    if sections:
+        return sections, None
+    embedding = encode(query)
+    return retrieve(embedding, collection, query=query, where=where), embedding
+
+
+def format_context(sections: List[dict]) -> str:
+    blocks = []
+    for section in sections:
+        label = section["label"] or "Section"
+        blocks.append(f"[{label}]\n{section['document']}")
+    return "\n\n".join(blocks)
+
+
+def section_list(sections: List[dict]) -> str:
+    labels = [s["label"] for s in sections if s["label"]]
+    return ", ".join(labels) if labels else "none identified"
@@ -0,0 +1,349 @@
+import argparse
+import os
+import secrets
+import threading
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Optional
+
+# ================= PATHS =================
+BASE_DIR = Path(__file__).resolve().parent
+# LEGAL_DB_PATH, LEGAL_MMAP_PATH and LEGAL_STATE_DIR move the index and the
+# session/query caches elsewhere (benchmark.py points them at a temp dir).
+DB_PATH = Path(os.environ.get("LEGAL_DB_PATH") or BASE_DIR / "chroma_db")
+VOSK_MODEL_PATH = BASE_DIR / "vosk-model-small-en-us-0.15"
+
+# Force all model/cache downloads to stay inside project
+CACHE_DIR = BASE_DIR / ".cache"
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+STATE_DIR = Path(os.environ.get("LEGAL_STATE_DIR") or CACHE_DIR)
+STATE_DIR.mkdir(parents=True, exist_ok=True)
+os.environ.setdefault("HF_HOME", str(CACHE_DIR / "hf"))
+os.environ.setdefault("TRANSFORMERS_CACHE", str(CACHE_DIR / "hf"))
+os.environ.setdefault("SENTENCE_TRANSFORMERS_HOME", str(CACHE_DIR / "sentence-transformers"))
+
+COLLECTION_NAME = "legal_laws"
+
+# "chroma" (chromadb.PersistentClient under DB_PATH) or "mmap" (the exact-search
+# index in mmap_index.py under MMAP_PATH, stored as int8, float16 or float32).
+VECTOR_BACKEND = os.environ.get("LEGAL_VECTOR_BACKEND", "chroma")
+MMAP_PATH = Path(os.environ.get("LEGAL_MMAP_PATH") or BASE_DIR / "mmap_index")
+MMAP_DTYPE = os.environ.get("LEGAL_MMAP_DTYPE", "int8")
+EMBED_MODEL = "all-MiniLM-L6-v2"
+
+# "torch" (SentenceTransformer), "onnx" or "onnx-int8" (onnxruntime, see
+# onnx_embedder.py). An ONNX export is only loaded after it passed the cosine
+# agreement check against the torch model; EMBED_NAMESPACE keeps cached query
+# vectors of different backends apart.
+EMBED_BACKEND = os.environ.get("LEGAL_EMBED_BACKEND", "torch")
+ONNX_DIR = CACHE_DIR / "onnx" / EMBED_MODEL
+EMBED_NAMESPACE = EMBED_MODEL if EMBED_BACKEND == "torch" else f"{EMBED_MODEL}:{EMBED_BACKEND}"
+LLM_MODEL = "mistral"
+
+# Ollama keeps the model, and the KV cache of the prompt it last evaluated,
+# loaded for LLM_KEEP_ALIVE. Every call uses the same num_ctx: a different
+# context size makes Ollama reload the model and lose that cache.
+LLM_KEEP_ALIVE = "30m"
+LLM_OPTIONS = {"num_ctx": 4096}
+
+# "ollama" or "llamacpp" (llama-server); LEGAL_LLM_HOST can point at another
+# server, e.g. llm_stub_server.py for offline load tests. The detected CPU/GPU
+# mode is remembered in LLM_MODE_FILE.
+LLM_BACKEND = os.environ.get("LEGAL_LLM_BACKEND", "ollama")
+LLM_HOST = os.environ.get("LEGAL_LLM_HOST") or None
+LLM_MODE_FILE = CACHE_DIR / "llm_mode.json"
+
+# ================= DAEMON =================
+DAEMON_ADDRESS = ("127.0.0.1", 47321)
+DAEMON_KEY_FILE = CACHE_DIR / "runtime_daemon.key"
+
+# ================= SHARED INSTANCES =================
+# Heavy objects are created on first use and then shared by every caller in
+# the process, so importing a module never pays for models it does not touch.
+_lock = threading.RLock()
+_instances = {}
+
+
+def _shared(name: str, factory):
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        if name not in _instances:
+            _instances[name] = factory()
+        return _instances[name]
+
+
+def get_embedder():
+    def load():
+        if EMBED_BACKEND == "torch":
+            from sentence_transformers import SentenceTransformer
+            return SentenceTransformer(EMBED_MODEL)
+        if EMBED_BACKEND not in ("onnx", "onnx-int8"):
+            raise ValueError(f"Unknown embedding backend: {EMBED_BACKEND}")
+
+        from onnx_embedder import OnnxEmbedder, model_file, read_agreement
+        quantized = EMBED_BACKEND == "onnx-int8"
+        check = read_agreement(ONNX_DIR).get(model_file(quantized), {})
+        if not check.get("passed"):
+            raise RuntimeError(
+                f"{model_file(quantized)} has not passed the agreement check against {EMBED_MODEL}; "
+                "run: python onnx_embedder.py --check"
+            )
+        return OnnxEmbedder(ONNX_DIR, quantized=quantized)
+    return _shared("embedder", load)
+
+
+def open_vector_store(backend: str = VECTOR_BACKEND, path: Optional[Path] = None):
+    if backend == "chroma":
+        import chromadb
+        return chromadb.PersistentClient(path=str(path or DB_PATH))
+    if backend == "mmap":
+        from mmap_index import MmapStore
+        return MmapStore(path or MMAP_PATH, dtype=MMAP_DTYPE)
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+def get_client():
+    return _shared("vector_store", open_vector_store)
+
+
+def get_collection(name: str = COLLECTION_NAME):
+    return _shared(f"collection:{name}", lambda: get_client().get_or_create_collection(name))
+
+
+def get_vosk_model():
+    def load():
+        import vosk
+        if not VOSK_MODEL_PATH.exists():
+            raise FileNotFoundError(f"Vosk model not found at {VOSK_MODEL_PATH}")
+        return vosk.Model(str(VOSK_MODEL_PATH))
+    return _shared("vosk_model", load)
+
+
+def get_llm(model: str = LLM_MODEL):
+    def load():
+        from llm_client import LLMClient
+        return LLMClient(
+            backend=LLM_BACKEND,
+            host=LLM_HOST,
+            model=model,
+            options=LLM_OPTIONS,
+            keep_alive=LLM_KEEP_ALIVE,
+            mode_file=LLM_MODE_FILE
+        )
+    return _shared(f"llm:{model}", load)
+
+
+def get_shard_pool():
+    # A shards.ShardPool while shards are registered (python shards.py add ...),
+    # otherwise None and retrieval uses the single collection. The registry is
+    # read on every call, so a running service picks up its first shard and
+    # stops the workers once the last one is removed.
+    from shards import ShardPool, read_registry
+    pool = _instances.get("shard_pool")
+    if not read_registry():
+        if pool is not None:
+            pool.refresh(force=True)
+        return None
+    return _shared("shard_pool", ShardPool)
+
+
+def reset_collection(name: str = COLLECTION_NAME) -> None:
+    with _lock:
+        _instances.pop(f"collection:{name}", None)
+
+
+def warm_up() -> None:
+    get_embedder()
+    if get_shard_pool() is None:
+        get_collection()
+
+
+class LazyEmbedder:
+    # Stand-in for SentenceTransformer that loads the model on the first encode().
+    def encode(self, *args, **kwargs):
+        return get_embedder().encode(*args, **kwargs)
+
+
+# ================= LOCAL OPERATIONS =================
+def search(query: str, encode, where: Optional[dict] = None) -> tuple:
+    # retrieval.search_sections over the single collection, or fanned out
+    # across the shard workers when shards are registered.
+    pool = get_shard_pool()
+    if pool is not None:
+        return pool.search(query, encode, where)
+    from retrieval import search_sections
+    return search_sections(query, get_collection(), encode, where=where)
+
+
+def local_retrieve(query: str, where: Optional[dict] = None) -> dict:
+    sections, embedding = search(query, lambda text: get_embedder().encode(text).tolist(), where)
+    return {"sections": sections, "embedding": embedding}
+
+
+def local_chat(messages: list, model: str = LLM_MODEL, options: Optional[dict] = None) -> str:
+    return get_llm(model).chat(messages, **(options or {}))
+
+
+def prime_llm() -> None:
+    # Loads the model and evaluates the constant system prompt once, so the
+    # first real question only pays for its own tokens.
+    from prompts import SYSTEM_PROMPT
+
+    try:
+        local_chat([{"role": "system", "content": SYSTEM_PROMPT}], options={"num_predict": 1})
+    except Exception as exc:
+        print(f"LLM warm-up skipped: {exc}")
+
+
+def local_ingest(data_path: Optional[str] = None, batch_size: int = 0, rebuild: bool = False) -> dict:
+    import vector_store
+    from chunking import iter_records
+
+    if rebuild:
+        try:
+            get_client().delete_collection(COLLECTION_NAME)
+        except Exception:
+            pass
+        reset_collection()
+
+    stats = vector_store.build_index(
+        iter_records(data_path or vector_store.DATA_PATH),
+        get_collection(),
+        get_embedder(),
+        batch_size=batch_size or vector_store.EMBED_BATCH_SIZE,
+        write_batch_size=get_client().get_max_batch_size()
+    )
+    links = stats.pop("links")
+    vector_store.write_section_links(links)
+    vector_store.write_index_version(stats["version"])
+    stats["links"] = sum(len(targets) for targets in links.values()) // 2
+    return stats
+
+
+def _handle(request: dict):
+    op = request.get("op")
+    if op == "ping":
+        return "pong"
+    if op == "retrieve":
+        return local_retrieve(request["query"], request.get("where"))
+    if op == "embed":
+        return get_embedder().encode(request["texts"]).tolist()
+    if op == "chat":
+        return local_chat(request["messages"], request.get("model", LLM_MODEL), request.get("options"))
+    if op == "ingest":
+        return local_ingest(request.get("data"), request.get("batch_size", 0), request.get("rebuild", False))
+    raise ValueError(f"Unknown op: {op}")
+
+
+# ================= DAEMON SERVER / CLIENT =================
+def _daemon_key(create: bool = False) -> Optional[bytes]:
+    if DAEMON_KEY_FILE.exists():
+        return DAEMON_KEY_FILE.read_bytes()
+    if not create:
+        return None
+    key = secrets.token_bytes(32)
+    DAEMON_KEY_FILE.write_bytes(key)
+    return key
+
+
+def _serve_connection(conn) -> None:
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            try:
+                conn.send({"ok": True, "result": _handle(request)})
+            except Exception as exc:
+                conn.send({"ok": False, "error": str(exc)})
+
+
+def serve() -> None:
+    print("Loading models...")
+    warm_up()
+    threading.Thread(target=prime_llm, daemon=True).start()
+    with Listener(DAEMON_ADDRESS, authkey=_daemon_key(create=True)) as listener:
+        print(f"Runtime daemon ready on {DAEMON_ADDRESS[0]}:{DAEMON_ADDRESS[1]}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve_connection, args=(conn,), daemon=True).start()
+
+
+class DaemonClient:
+    def __init__(self, conn) -> None:
+        self.conn = conn
+
+    def call(self, op: str, **kwargs):
+        self.conn.send({"op": op, **kwargs})
+        reply = self.conn.recv()
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def connect_daemon() -> Optional[DaemonClient]:
+    key = _daemon_key()
+    if key is None:
+        return None
+    try:
+        return DaemonClient(Client(DAEMON_ADDRESS, authkey=key))
+    except (ConnectionRefusedError, OSError):
+        return None
+
+
+def daemon_running() -> bool:
+    client = connect_daemon()
+    if client is None:
+        return False
+    try:
+        return client.call("ping") == "pong"
+    except Exception:
+        return False
+    finally:
+        client.close()
+
+
+def _call(op: str, **kwargs):
+    # Prefer the warm daemon when it is up; otherwise do the work in-process.
+    client = connect_daemon()
+    if client is not None:
+        try:
+            return client.call(op, **kwargs)
+        finally:
+            client.close()
+    return _handle({"op": op, **kwargs})
+
+
+def embed(texts: list) -> list:
+    return _call("embed", texts=texts)
+
+
+def retrieve(query: str, where: Optional[dict] = None) -> dict:
+    # {"sections": [...], "embedding": [...] or None}; see retrieval.search_sections.
+    # where is a metadata filter, e.g. legal_metadata.where_filter(type="punishment").
+    return _call("retrieve", query=query, where=where)
+
+
+def chat(messages: list, model: str = LLM_MODEL, options: Optional[dict] = None) -> str:
+    return _call("chat", messages=messages, model=model, options=options)
+
+
+def ingest(data_path: Optional[str] = None, batch_size: int = 0, rebuild: bool = False) -> dict:
+    return _call("ingest", data=data_path, batch_size=batch_size, rebuild=rebuild)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared model runtime for the legal assistant tools.")
+    parser.add_argument("--serve", action="store_true", help="Run the warm runtime daemon")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+    else:
+        print("Daemon running" if daemon_running() else "Daemon not running")
@@ -0,0 +1,281 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+# ================= CONFIG =================
+# Each session keeps at most max_turns messages (a ring buffer: the oldest is
+# overwritten), sessions idle for ttl_seconds are dropped, and once the stored
+# text of all sessions exceeds max_bytes the least recently used go first.
+MAX_TURNS = 12
+TTL_SECONDS = 6 * 3600
+MAX_BYTES = 32 * 1024 * 1024
+EVICT_INTERVAL_SECONDS = 60
+
+
+def _turn_size(role: str, content: str) -> int:
+    return len(role) + len(content.encode("utf-8"))
+
+
+@dataclass
+class _Session:
+    turns: deque
+    last_seen: float
+    size: int = 0
+    sizes: deque = field(default_factory=deque)
+    next_seq: int = 0
+    summary: str = ""
+    summary_seq: int = -1
+
+
+class MemorySessionStore:
+    def __init__(self, max_turns: int = MAX_TURNS, ttl_seconds: float = TTL_SECONDS,
+                 max_bytes: int = MAX_BYTES) -> None:
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        # Sessions are ordered by last use, so expired ones are at the front.
+        while self._sessions:
+            sid, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_seen <= self.ttl_seconds and self._bytes <= self.max_bytes:
+                break
+            del self._sessions[sid]
+            self._bytes -= oldest.size
+            self.evicted += 1
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        now = time.time()
+        size = _turn_size(role, content)
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = _Session(turns=deque(maxlen=self.max_turns), last_seen=now)
+                self._sessions[session_id] = entry
+            if len(entry.turns) == self.max_turns:
+                dropped = entry.sizes.popleft()
+                entry.size -= dropped
+                self._bytes -= dropped
+            entry.turns.append({"role": role, "content": content, "seq": entry.next_seq})
+            entry.next_seq += 1
+            entry.sizes.append(size)
+            entry.size += size
+            entry.last_seen = now
+            self._bytes += size
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def history(self, session_id: str, limit: Optional[int] = None) -> list:
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if now - entry.last_seen > self.ttl_seconds:
+                self._evict(now)
+                return []
+            turns = list(entry.turns)
+        return turns[-limit:] if limit else turns
+
+    def summary(self, session_id: str) -> tuple:
+        # (text, seq): the rolling summary covers every turn up to seq.
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return "", -1
+            return entry.summary, entry.summary_seq
+
+    def set_summary(self, session_id: str, text: str, seq: int) -> None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            delta = len(text.encode("utf-8")) - len(entry.summary.encode("utf-8"))
+            entry.summary, entry.summary_seq = text, seq
+            entry.size += delta
+            self._bytes += delta
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_turns": self.max_turns,
+                "evicted": self.evicted,
+            }
+
+
+class SQLiteSessionStore:
+    # Shared by every worker process that opens the same file. WAL mode lets
+    # readers run while another process writes. Turns live in max_turns slots
+    # per session (slot = seq % max_turns), so a session never grows past its cap.
+    # Writes run in BEGIN IMMEDIATE transactions: the write lock is taken before
+    # next_seq is read, so two processes appending to one session cannot both
+    # take the same seq.
+    def __init__(self, path: Path, max_turns: int = MAX_TURNS, ttl_seconds: float = TTL_SECONDS,
+                 max_bytes: int = MAX_BYTES) -> None:
+        self.path = Path(path)
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self._last_evict = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, last_seen REAL, next_seq INTEGER, bytes INTEGER, "
+            "summary TEXT DEFAULT '', summary_seq INTEGER DEFAULT -1);"
+            "CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);"
+            "CREATE TABLE IF NOT EXISTS session_turns ("
+            "session_id TEXT, slot INTEGER, seq INTEGER, role TEXT, content TEXT, bytes INTEGER, "
+            "PRIMARY KEY (session_id, slot));"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        if "summary" not in columns:
+            self._db.execute("ALTER TABLE sessions ADD COLUMN summary TEXT DEFAULT ''")
+            self._db.execute("ALTER TABLE sessions ADD COLUMN summary_seq INTEGER DEFAULT -1")
+
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _delete_sessions(self, session_ids: list) -> None:
+        for sid in session_ids:
+            self._db.execute("DELETE FROM session_turns WHERE session_id = ?", (sid,))
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (sid,))
+        self.evicted += len(session_ids)
+
+    def _evict(self, now: float) -> None:
+        if now - self._last_evict < EVICT_INTERVAL_SECONDS:
+            return
+        self._last_evict = now
+        expired = [row[0] for row in self._db.execute(
+            "SELECT session_id FROM sessions WHERE last_seen < ?", (now - self.ttl_seconds,)
+        )]
+        self._delete_sessions(expired)
+
+        total = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM sessions").fetchone()[0]
+        if total > self.max_bytes:
+            victims = []
+            for sid, size in self._db.execute("SELECT session_id, bytes FROM sessions ORDER BY last_seen"):
+                if total <= self.max_bytes:
+                    break
+                victims.append(sid)
+                total -= size
+            self._delete_sessions(victims)
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        now = time.time()
+        size = _turn_size(role, content)
+        with self._write():
+            row = self._db.execute(
+                "SELECT next_seq FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            seq = row[0] if row else 0
+            slot = seq % self.max_turns
+            replaced = self._db.execute(
+                "SELECT bytes FROM session_turns WHERE session_id = ? AND slot = ?", (session_id, slot)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO session_turns (session_id, slot, seq, role, content, bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, slot, seq, role, content, size)
+            )
+            delta = size - (replaced[0] if replaced else 0)
+            if row:
+                self._db.execute(
+                    "UPDATE sessions SET last_seen = ?, next_seq = ?, bytes = bytes + ? WHERE session_id = ?",
+                    (now, seq + 1, delta, session_id)
+                )
+            else:
+                self._db.execute(
+                    "INSERT INTO sessions (session_id, last_seen, next_seq, bytes) VALUES (?, ?, ?, ?)",
+                    (session_id, now, seq + 1, size)
+                )
+            self._evict(now)
+
+    def history(self, session_id: str, limit: Optional[int] = None) -> list:
+        limit = min(limit or self.max_turns, self.max_turns)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT last_seen FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or time.time() - row[0] > self.ttl_seconds:
+                return []
+            rows = self._db.execute(
+                "SELECT role, content, seq FROM session_turns WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return [{"role": role, "content": content, "seq": seq} for role, content, seq in reversed(rows)]
+
+    def summary(self, session_id: str) -> tuple:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary, summary_seq FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return (row[0] or "", row[1]) if row else ("", -1)
+
+    def set_summary(self, session_id: str, text: str, seq: int) -> None:
+        with self._write():
+            row = self._db.execute(
+                "SELECT summary FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return
+            delta = len(text.encode("utf-8")) - len((row[0] or "").encode("utf-8"))
+            self._db.execute(
+                "UPDATE sessions SET summary = ?, summary_seq = ?, bytes = bytes + ? WHERE session_id = ?",
+                (text, seq, delta, session_id)
+            )
+
+    def clear(self, session_id: str) -> None:
+        with self._write():
+            self._db.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "max_turns": self.max_turns,
+            "evicted": self.evicted,
+        }
+
+
+def create_session_store(path: Optional[Path] = None, **kwargs):
+    if path is None:
+        return MemorySessionStore(**kwargs)
+    return SQLiteSessionStore(path, **kwargs)
@@ -0,0 +1,542 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import runtime
+from lexical_index import CITATION_PATTERN
+from retrieval import CONTEXT_TOKEN_BUDGET, FETCH_K, TOP_K, pack_sections, rank_candidates
+from runtime import DB_PATH
+
+# ================= CONFIG =================
+# Retrieval split by Act or corpus: every shard is its own collection, served
+# by its own worker process(es). A query is fanned out to all shards in
+# parallel and the partial candidate lists are merged and re-ranked here.
+#
+# SHARDS_FILE maps shard name -> collection. A rebuild writes a fresh
+# collection, seeded with the previous one's vectors so only new or edited
+# sections are embedded, and then switches the entry; the running service
+# keeps answering from the old collection until the new workers are ready.
+#
+# Shards always live in the mmap index (mmap_index.py), whatever
+# LEGAL_VECTOR_BACKEND says: several worker processes read it while the CLI
+# writes new collections, which Chroma's PersistentClient does not support.
+SHARDS_FILE = DB_PATH / "shards.json"
+SHARD_BACKEND = "mmap"
+SHARD_REPLICAS = 1
+SHARD_TIMEOUT_SECONDS = 10.0
+WORKER_START_TIMEOUT_SECONDS = 120.0
+RELOAD_CHECK_SECONDS = 2.0
+KEEP_OLD_COLLECTIONS = 1
+SHARD_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,40}$")
+
+
+class ShardError(Exception):
+    pass
+
+
+_store = None
+
+
+def shard_store():
+    global _store
+    if _store is None:
+        _store = runtime.open_vector_store(SHARD_BACKEND)
+    return _store
+
+
+# ================= REGISTRY =================
+def read_registry(path: Path = SHARDS_FILE) -> dict:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def write_registry(registry: dict, path: Path = SHARDS_FILE) -> None:
+    # Atomic, so servers polling the file never read half of it. The combined
+    # index version changes with any shard, which invalidates answer caches.
+    from vector_store import write_index_version
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_suffix(".tmp")
+    staging.write_text(json.dumps(registry, indent=2), encoding="utf-8")
+    os.replace(staging, path)
+    combined = "\n".join(f"{name}:{entry['version']}:{entry.get('generation', 0)}"
+                         for name, entry in sorted(registry.items()))
+    write_index_version(hashlib.sha1(combined.encode("utf-8")).hexdigest())
+
+
+def _copy_collection(source, target, batch_size: int) -> int:
+    ids = source.get(include=[])["ids"]
+    for start in range(0, len(ids), batch_size):
+        part = source.get(ids=ids[start:start + batch_size], include=["documents", "metadatas", "embeddings"])
+        target.upsert(ids=part["ids"], documents=part["documents"], embeddings=part["embeddings"],
+                      metadatas=part["metadatas"])
+    return len(ids)
+
+
+def build_shard(name: str, data_path: str, batch_size: int = 0, full: bool = False) -> dict:
+    # Ingests data_path into a new collection and points the shard at it.
+    # Unless full is set, the new collection starts as a copy of the current
+    # one, so build_index only embeds sections whose text changed.
+    import vector_store
+    from chunking import iter_records
+
+    if not SHARD_NAME.match(name):
+        raise ShardError(f"Invalid shard name: {name!r} (use lowercase letters, digits, '-' and '_')")
+    # The random suffix keeps two builds in the same second apart; a rebuild
+    # must never write into the collection its workers are serving.
+    collection_name = f"shard-{name}-{time.strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(4)}"
+    store = shard_store()
+    collection = store.get_or_create_collection(collection_name)
+    previous = read_registry().get(name, {})
+    if previous and not full:
+        try:
+            source = store.get_collection(previous["collection"])
+        except ValueError:
+            source = None
+        if source is not None:
+            _copy_collection(source, collection, store.get_max_batch_size())
+    stats = vector_store.build_index(
+        iter_records(data_path),
+        collection,
+        runtime.get_embedder(),
+        batch_size=batch_size or vector_store.EMBED_BATCH_SIZE,
+        write_batch_size=store.get_max_batch_size()
+    )
+    links = stats.pop("links")
+    target = vector_store.collection_dir(collection_name)
+    vector_store.write_section_links(links, target)
+    vector_store.write_index_version(stats["version"], target)
+
+    registry = read_registry()
+    previous = registry.get(name, {})
+    retired = []
+    for old in previous.get("retired", []) + [previous.get("collection")]:
+        if old and old != collection_name and old not in retired:
+            retired.append(old)
+    registry[name] = {
+        "collection": collection_name,
+        "data": str(Path(data_path).resolve()),
+        "version": stats["version"],
+        "generation": previous.get("generation", 0) + 1,
+        "retired": retired,
+    }
+    _drop_retired(registry[name])
+    write_registry(registry)
+    stats["collection"] = collection_name
+    stats["links"] = sum(len(targets) for targets in links.values()) // 2
+    return stats
+
+
+def _drop_retired(entry: dict) -> None:
+    # The newest retired collection may still be served by workers that have
+    # not switched yet; older ones are deleted.
+    retired = entry.get("retired", [])
+    keep = retired[-KEEP_OLD_COLLECTIONS:] if KEEP_OLD_COLLECTIONS else []
+    for collection_name in retired[:len(retired) - len(keep)]:
+        if collection_name != entry["collection"]:
+            _delete_collection(collection_name)
+    entry["retired"] = keep
+
+
+def _delete_collection(collection_name: str) -> None:
+    import shutil
+
+    from vector_store import collection_dir
+
+    try:
+        shard_store().delete_collection(collection_name)
+    except Exception:
+        pass
+    shutil.rmtree(collection_dir(collection_name), ignore_errors=True)
+
+
+def remove_shard(name: str) -> None:
+    registry = read_registry()
+    entry = registry.pop(name, None)
+    if entry is None:
+        raise ShardError(f"Unknown shard: {name}")
+    write_registry(registry)
+    # Running services stop the shard's workers on their next check.
+    for collection_name in entry.get("retired", []) + [entry["collection"]]:
+        _delete_collection(collection_name)
+
+
+def reload_shard(name: str) -> None:
+    # Makes running services restart the shard's workers without re-embedding.
+    registry = read_registry()
+    if name not in registry:
+        raise ShardError(f"Unknown shard: {name}")
+    registry[name]["generation"] = registry[name].get("generation", 0) + 1
+    write_registry(registry)
+
+
+# ================= WORKER PROCESS =================
+def _handle(collection, request: dict):
+    from retrieval import cited_sections, gather_candidates, with_linked_sections
+
+    op = request.get("op")
+    if op == "ping":
+        return "pong"
+    if op == "cited":
+        return cited_sections(request["query"], collection, request.get("where"))
+    if op == "candidates":
+        return gather_candidates(request["embedding"], collection, request.get("query"),
+                                 request.get("fetch_k", FETCH_K), request.get("where"))
+    if op == "linked":
+        return with_linked_sections(request["sections"], collection, request.get("where"))
+    raise ValueError(f"Unknown op: {op}")
+
+
+def worker_main(collection_name: str) -> None:
+    # Started by ShardWorker: reads the auth key from stdin, loads the
+    # collection and its BM25 index, prints its port and serves one connection.
+    # Anything printed later goes to stderr; the parent stops reading stdout.
+    # A missing collection is an error: the worker exits before printing its
+    # port instead of serving an empty shard.
+    from retrieval import get_lexical_index
+
+    key = bytes.fromhex(sys.stdin.readline().strip())
+    collection = shard_store().get_collection(collection_name)
+    get_lexical_index(collection)
+    with Listener(("127.0.0.1", 0), authkey=key) as listener:
+        print(f"PORT {listener.address[1]}", flush=True)
+        sys.stdout = sys.stderr
+        with listener.accept() as conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    conn.send({"ok": True, "result": _handle(collection, request)})
+                except Exception as exc:
+                    conn.send({"ok": False, "error": str(exc)})
+
+
+class ShardWorker:
+    # Parent-side handle of one worker process; calls are serialized.
+    def __init__(self, shard: str, collection_name: str) -> None:
+        self.shard = shard
+        self.collection_name = collection_name
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        key = secrets.token_bytes(32)
+        self.process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "--worker", collection_name],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self.process.stdin.write(key.hex().encode() + b"\n")
+        self.process.stdin.close()
+        port = self._read_port()
+        self.conn = Client(("127.0.0.1", port), authkey=key)
+
+    def _read_port(self) -> int:
+        # Libraries may print before the worker is ready; only "PORT n" counts.
+        result = {}
+
+        def read() -> None:
+            for line in iter(self.process.stdout.readline, b""):
+                if line.startswith(b"PORT "):
+                    result["port"] = int(line.split()[1])
+                    return
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        reader.join(WORKER_START_TIMEOUT_SECONDS)
+        if "port" not in result:
+            self.process.kill()
+            raise ShardError(f"Shard worker for {self.collection_name} failed to start")
+        self.process.stdout.close()
+        return result["port"]
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def call(self, op: str, timeout: float = SHARD_TIMEOUT_SECONDS, **kwargs):
+        with self._lock:
+            self.requests += 1
+            try:
+                self.conn.send({"op": op, **kwargs})
+                if not self.conn.poll(timeout):
+                    # The reply would arrive out of order later; this worker is done.
+                    self.stop()
+                    raise ShardError(f"Shard {self.shard} did not answer within {timeout:.0f}s")
+                reply = self.conn.recv()
+            except (EOFError, OSError) as exc:
+                self.errors += 1
+                raise ShardError(f"Shard {self.shard} worker is gone: {exc}") from exc
+            except ShardError:
+                self.errors += 1
+                raise
+        if not reply["ok"]:
+            self.errors += 1
+            raise ShardError(f"Shard {self.shard}: {reply['error']}")
+        return reply["result"]
+
+    def stop(self) -> None:
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        if self.process.poll() is None:
+            self.process.terminate()
+
+
+# ================= POOL =================
+class ShardPool:
+    # Fans queries out to every shard and merges the results. A shard whose
+    # entry in SHARDS_FILE changes (rebuild, reload) gets new workers in the
+    # background; the old ones keep answering until the new ones are up. A
+    # failing shard is skipped for that query and restarted.
+    def __init__(self, registry_path: Path = SHARDS_FILE, replicas: int = SHARD_REPLICAS) -> None:
+        self.registry_path = Path(registry_path)
+        self.replicas = replicas
+        self.restarts = 0
+        self.failures = 0
+        self._workers: Dict[str, List[ShardWorker]] = {}
+        self._entries: Dict[str, dict] = {}
+        self._starting = set()
+        self._next = 0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="shard-call")
+        registry = read_registry(self.registry_path)
+        for name, entry in registry.items():
+            try:
+                self._start(name, entry)
+            except ShardError as exc:
+                # Retried by refresh() while the rest of the shards serve.
+                print(f"Shard {name} not started: {exc}")
+        self._checked = time.monotonic()
+
+    # ---------- lifecycle ----------
+    def _start(self, name: str, entry: dict) -> None:
+        workers = [ShardWorker(name, entry["collection"]) for _ in range(self.replicas)]
+        with self._lock:
+            old = self._workers.get(name, [])
+            self._workers[name] = workers
+            self._entries[name] = entry
+        for worker in old:
+            worker.stop()
+
+    def _start_in_background(self, name: str, entry: dict) -> None:
+        with self._lock:
+            if name in self._starting:
+                return
+            self._starting.add(name)
+
+        def run() -> None:
+            try:
+                self._start(name, entry)
+                self.restarts += 1
+            except ShardError as exc:
+                print(f"Shard {name} not reloaded: {exc}")
+            finally:
+                with self._lock:
+                    self._starting.discard(name)
+
+        threading.Thread(target=run, name=f"shard-start-{name}", daemon=True).start()
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked < RELOAD_CHECK_SECONDS:
+            return
+        self._checked = now
+        registry = read_registry(self.registry_path)
+        with self._lock:
+            current = dict(self._entries)
+            dead = [name for name, workers in self._workers.items() if not all(w.alive for w in workers)]
+        for name, entry in registry.items():
+            known = current.get(name)
+            changed = known is None or (known["collection"], known.get("generation")) != (
+                entry["collection"], entry.get("generation"))
+            if changed or name in dead:
+                self._start_in_background(name, entry)
+        for name in set(current) - set(registry):
+            with self._lock:
+                workers = self._workers.pop(name, [])
+                self._entries.pop(name, None)
+            for worker in workers:
+                worker.stop()
+
+    def close(self) -> None:
+        with self._lock:
+            workers = [w for group in self._workers.values() for w in group]
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+    # ---------- fan-out ----------
+    def _pick(self, name: str) -> Optional[ShardWorker]:
+        with self._lock:
+            workers = [w for w in self._workers.get(name, []) if w.alive]
+            if not workers:
+                return None
+            self._next += 1
+            idle = [w for w in workers if not w.busy()]
+            return (idle or workers)[self._next % len(idle or workers)]
+
+    def _fan_out(self, op: str, names: List[str], payloads: Optional[Dict[str, dict]] = None,
+                 **kwargs) -> Dict[str, object]:
+        futures = {}
+        for name in names:
+            worker = self._pick(name)
+            if worker is None:
+                continue
+            extra = payloads.get(name, {}) if payloads else {}
+            futures[name] = self._pool.submit(worker.call, op, **kwargs, **extra)
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except ShardError as exc:
+                self.failures += 1
+                print(f"Shard {name} skipped: {exc}")
+                self._checked = 0.0
+        return results
+
+    def shards(self) -> List[str]:
+        with self._lock:
+            return sorted(self._workers)
+
+    def search(self, query: str, encode: Callable[[str], List[float]], where: Optional[dict] = None,
+               top_k: int = TOP_K, fetch_k: int = FETCH_K,
+               token_budget: int = CONTEXT_TOKEN_BUDGET) -> tuple:
+        # Same contract as retrieval.search_sections; every section also
+        # carries the name of the shard it came from.
+        self.refresh()
+        names = self.shards()
+
+        if CITATION_PATTERN.search(query):
+            cited = self._fan_out("cited", names, query=query, where=where)
+            sections = [dict(s, shard=name) for name in names for s in cited.get(name, [])]
+            if sections:
+                return pack_sections(sections, token_budget), None
+
+        embedding = list(encode(query))
+        partial = self._fan_out("candidates", names, embedding=embedding, query=query,
+                                fetch_k=max(top_k, fetch_k), where=where)
+        candidates = []
+        owner = {}
+        for name in names:
+            for candidate in partial.get(name, []):
+                if candidate["id"] not in owner:
+                    owner[candidate["id"]] = name
+                    candidates.append(candidate)
+        picked = [dict(s, shard=owner[s["id"]]) for s in rank_candidates(embedding, candidates, top_k, fetch_k)]
+        return pack_sections(self._with_linked(picked, where), token_budget), embedding
+
+    def _with_linked(self, sections: List[dict], where: Optional[dict]) -> List[dict]:
+        # Each shard adds the linked sections of its own hits; the groups are
+        # put back in the merged order.
+        by_shard: Dict[str, List[dict]] = {}
+        for section in sections:
+            by_shard.setdefault(section["shard"], []).append(section)
+        payloads = {name: {"sections": group} for name, group in by_shard.items()}
+        joined = self._fan_out("linked", list(by_shard), payloads, where=where)
+
+        groups: Dict[str, List[dict]] = {}
+        for name, group in by_shard.items():
+            primary = {s["id"] for s in group}
+            current = None
+            for section in joined.get(name, group):
+                if section["id"] in primary:
+                    current = section["id"]
+                    groups[current] = []
+                elif current is not None:
+                    groups[current].append(dict(section, shard=name))
+        result, seen = [], set()
+        for section in sections:
+            for item in [section] + groups.get(section["id"], []):
+                if item["id"] not in seen:
+                    seen.add(item["id"])
+                    result.append(item)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            shards = {
+                name: {
+                    "collection": self._entries[name]["collection"],
+                    "version": self._entries[name].get("version"),
+                    "workers": [
+                        {"pid": w.process.pid, "alive": w.alive, "requests": w.requests, "errors": w.errors}
+                        for w in workers
+                    ],
+                }
+                for name, workers in self._workers.items()
+            }
+        return {"shards": shards, "restarts": self.restarts, "failures": self.failures}
+
+
+# ================= CLI =================
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage retrieval shards (one collection per Act or corpus).")
+    parser.add_argument("--worker", metavar="COLLECTION", help=argparse.SUPPRESS)
+    sub = parser.add_subparsers(dest="command")
+    add = sub.add_parser("add", help="Create a shard from a text file, or rebuild it from a new one")
+    add.add_argument("name")
+    add.add_argument("data")
+    rebuild = sub.add_parser("rebuild", help="Re-ingest a shard from its source file")
+    rebuild.add_argument("name")
+    for command in (add, rebuild):
+        command.add_argument("--batch-size", type=int, default=0)
+        command.add_argument("--full", action="store_true",
+                             help="Embed every section again instead of reusing unchanged ones")
+    sub.add_parser("list", help="Show registered shards")
+    for command, help_text in (("reload", "Restart a shard's workers in running services"),
+                               ("remove", "Unregister a shard")):
+        sub.add_parser(command, help=help_text).add_argument("name")
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args.worker)
+        return
+
+    if args.command in ("add", "rebuild"):
+        if args.command == "rebuild":
+            entry = read_registry().get(args.name)
+            if entry is None:
+                parser.error(f"unknown shard: {args.name}")
+            data = entry["data"]
+        else:
+            data = args.data
+        stats = build_shard(args.name, data, args.batch_size, args.full)
+        print(f"Shard {args.name}: {stats['total']} sections in {stats['collection']} "
+              f"({stats['added']} embedded, {stats['deleted']} removed), "
+              f"{stats['links']} definition/punishment links")
+    elif args.command == "reload":
+        reload_shard(args.name)
+        print(f"Shard {args.name} will be reloaded by running services")
+    elif args.command == "remove":
+        remove_shard(args.name)
+        print(f"Shard {args.name} removed")
+    else:
+        registry = read_registry()
+        if not registry:
+            print("No shards registered; retrieval uses the single collection.")
+        for name, entry in sorted(registry.items()):
+            print(f"{name}: {entry['collection']} (generation {entry.get('generation', 0)}, from {entry['data']})")
+
+
+if __name__ == "__main__":
+    main()
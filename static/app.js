@@ -5,16 +5,17 @@ const micBtn = document.getElementById("micBtn");
 const clearBtn = document.getElementById("clearBtn");
 const statusEl = document.getElementById("status");
 
-function addMessage(role, text) {
+function addMessage(role, text, speak = true) {
   const div = document.createElement("div");
   div.className = `message ${role}`;
   div.textContent = text;
   chat.appendChild(div);
   chat.scrollTop = chat.scrollHeight;
 
-  if (role === "assistant") {
+  if (role === "assistant" && speak) {
     speakText(text);
   }
+  return div;
 }
 
 function speakText(text) {
@@ -26,12 +27,7 @@ function speakText(text) {
   window.speechSynthesis.speak(utter);
 }
 
-async function sendQuery(text) {
-  if (!text.trim()) return;
-  addMessage("user", text.trim());
-  input.value = "";
-
-  statusEl.textContent = "Thinking...";
+async function askOnce(text) {
   const response = await fetch("/ask", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
@@ -39,10 +35,111 @@ async function sendQuery(text) {
   });
   const data = await response.json();
   addMessage("assistant", data.answer || "No response.");
+}
+
+async function askStreaming(text) {
+  const response = await fetch("/ask/stream", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ query: text })
+  });
+  if (response.status === 429) {
+    const data = await response.json();
+    addMessage("assistant", data.answer || "The assistant is busy right now.");
+    return;
+  }
+  if (!response.ok || !response.body) {
+    throw new Error("Streaming unavailable");
+  }
+
+  const div = addMessage("assistant", "", false);
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let answer = "";
+
+  try {
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const event = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        if (!event.startsWith("data: ")) continue;
+
+        const data = JSON.parse(event.slice(6));
+        if (data.queued) {
+          statusEl.textContent = `Queued (position ${data.queued})`;
+        }
+        if (data.token) {
+          if (!answer) statusEl.textContent = "Answering...";
+          answer += data.token;
+          div.textContent = answer;
+        }
+        if (data.done) {
+          answer = data.answer || answer || "No response.";
+          div.textContent = answer;
+        }
+        chat.scrollTop = chat.scrollHeight;
+      }
+    }
+  } catch (err) {
+    // Before the first token the question can be asked again with /ask. After
+    // it the server is already answering (and will store the turn), so asking
+    // again would add the question to the history twice.
+    if (!answer) {
+      div.remove();
+      throw err;
+    }
+    div.textContent = `${answer} (connection lost; the answer may be incomplete)`;
+  }
+  speakText(answer || "No response.");
+}
+
+// While the user types (or speaks, with live partials), the current text is
+// sent to /prefetch after a short pause so retrieval is ready on submit.
+const PREFETCH_DELAY_MS = 400;
+// Same as CITATION_PATTERN in lexical_index.py: short citations are not "too short".
+const CITATION = /\b(?:(?:bnss|crpc|ipc|bns|bsa)\s*(?:section|sec|s)?|section|sec)\.?\s*\d+[a-z]?\b/i;
+let prefetchTimer = null;
+let lastPrefetched = "";
+
+function schedulePrefetch(text) {
+  clearTimeout(prefetchTimer);
+  prefetchTimer = setTimeout(() => {
+    const query = text.trim();
+    const words = query.split(/\s+/).length;
+    if (query === lastPrefetched || (words < 4 && !/ipc/i.test(query) && !CITATION.test(query))) return;
+    lastPrefetched = query;
+    fetch("/prefetch", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ query })
+    }).catch(() => {});
+  }, PREFETCH_DELAY_MS);
+}
+
+async function sendQuery(text) {
+  if (!text.trim()) return;
+  clearTimeout(prefetchTimer);
+  lastPrefetched = "";
+  addMessage("user", text.trim());
+  input.value = "";
+
+  statusEl.textContent = "Thinking...";
+  try {
+    await askStreaming(text);
+  } catch (err) {
+    await askOnce(text);
+  }
   statusEl.textContent = "Idle";
 }
 
 sendBtn.addEventListener("click", () => sendQuery(input.value));
+input.addEventListener("input", () => schedulePrefetch(input.value));
 input.addEventListener("keydown", (e) => {
   if (e.key === "Enter" && !e.shiftKey) {
     e.preventDefault();
@@ -54,8 +151,153 @@ clearBtn.addEventListener("click", () => {
   chat.innerHTML = "";
 });
 
+// Speech is recognized on the server by Vosk (/transcribe), so the mic works
+// offline and in every browser. The browser only captures audio and converts
+// it to 16 kHz mono 16-bit PCM. With the ASGI server, audio is streamed over
+// /transcribe/ws and partial text is shown while speaking; otherwise the
+// recording is uploaded when the user stops.
+const STT_SAMPLE_RATE = 16000;
+const MAX_RECORD_MS = 15000;
+let recording = null;
+
+function toPcm16(samples, inputRate) {
+  const ratio = inputRate / STT_SAMPLE_RATE;
+  const length = Math.floor(samples.length / ratio);
+  const pcm = new Int16Array(length);
+  for (let i = 0; i < length; i++) {
+    const start = Math.floor(i * ratio);
+    const end = Math.min(samples.length, Math.floor((i + 1) * ratio));
+    let sum = 0;
+    for (let j = start; j < end; j++) sum += samples[j];
+    const value = Math.max(-1, Math.min(1, sum / Math.max(1, end - start)));
+    pcm[i] = value < 0 ? value * 0x8000 : value * 0x7fff;
+  }
+  return pcm;
+}
+
+function openTranscribeSocket() {
+  return new Promise((resolve) => {
+    const protocol = location.protocol === "https:" ? "wss:" : "ws:";
+    let socket;
+    try {
+      socket = new WebSocket(`${protocol}//${location.host}/transcribe/ws`);
+    } catch (err) {
+      resolve(null);
+      return;
+    }
+    socket.binaryType = "arraybuffer";
+    socket.onopen = () => resolve(socket);
+    socket.onerror = () => resolve(null);
+  });
+}
+
+async function startRecording() {
+  const stream = await navigator.mediaDevices.getUserMedia({
+    audio: { channelCount: 1, echoCancellation: true, noiseSuppression: true }
+  });
+  const context = new (window.AudioContext || window.webkitAudioContext)();
+  const source = context.createMediaStreamSource(stream);
+  const processor = context.createScriptProcessor(4096, 1, 1);
+  const socket = await openTranscribeSocket();
+  const chunks = [];
+
+  if (socket) {
+    socket.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.partial) {
+        statusEl.textContent = `Listening: ${data.partial}`;
+        schedulePrefetch(data.partial);
+      }
+    };
+  }
+
+  processor.onaudioprocess = (event) => {
+    const pcm = toPcm16(event.inputBuffer.getChannelData(0), context.sampleRate);
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(pcm.buffer);
+    } else {
+      chunks.push(pcm);
+    }
+  };
+  source.connect(processor);
+  processor.connect(context.destination);
+
+  recording = {
+    stream, context, processor, socket, chunks,
+    timer: setTimeout(stopRecording, MAX_RECORD_MS)
+  };
+  micBtn.textContent = "Stop";
+  statusEl.textContent = "Listening...";
+}
+
+function finishSocket(socket) {
+  return new Promise((resolve) => {
+    socket.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.partial !== undefined) return;
+      resolve(data.text || "");
+    };
+    socket.onclose = () => resolve("");
+    socket.send("end");
+  });
+}
+
+async function uploadRecording(chunks) {
+  const response = await fetch("/transcribe", {
+    method: "POST",
+    headers: { "Content-Type": "application/octet-stream" },
+    body: new Blob(chunks)
+  });
+  const data = await response.json();
+  return data.text || "";
+}
+
+async function stopRecording() {
+  if (!recording) return;
+  const { stream, context, processor, socket, chunks, timer } = recording;
+  recording = null;
+  clearTimeout(timer);
+  processor.disconnect();
+  stream.getTracks().forEach((track) => track.stop());
+  context.close();
+  micBtn.textContent = "Speak";
+  statusEl.textContent = "Transcribing...";
+
+  let text = "";
+  try {
+    if (socket && socket.readyState === WebSocket.OPEN && !chunks.length) {
+      text = await finishSocket(socket);
+    } else {
+      if (socket) socket.close();
+      text = await uploadRecording(chunks);
+    }
+  } catch (err) {
+    statusEl.textContent = "Mic error";
+    return;
+  }
+  if (text.trim()) {
+    sendQuery(text);
+  } else {
+    statusEl.textContent = "Didn't catch that";
+  }
+}
+
 const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
-if (SpeechRecognition) {
+if (navigator.mediaDevices && navigator.mediaDevices.getUserMedia) {
+  micBtn.addEventListener("click", async () => {
+    if (recording) {
+      stopRecording();
+      return;
+    }
+    try {
+      await startRecording();
+    } catch (err) {
+      statusEl.textContent = "Mic error";
+    }
+  });
+} else if (SpeechRecognition) {
+  // getUserMedia needs https or localhost; other origins fall back to the
+  // browser recognizer where one exists.
   const recognizer = new SpeechRecognition();
   recognizer.lang = "en-IN";
   recognizer.interimResults = false;
@@ -0,0 +1,64 @@
+import json
+from typing import Optional
+
+import vosk
+
+STABLE_FRAMES = 10
+MIN_STABLE_WORDS = 3
+
+
+class StreamingTranscriber:
+    # Feeds audio to Vosk frame by frame while the user is still speaking, so
+    # the final result is ready as soon as the utterance ends.
+    def __init__(self, model, sample_rate: int, stable_frames: int = STABLE_FRAMES,
+                 min_stable_words: int = MIN_STABLE_WORDS) -> None:
+        self.rec = vosk.KaldiRecognizer(model, sample_rate)
+        self.rec.SetWords(True)
+        self.stable_frames = stable_frames
+        self.min_stable_words = min_stable_words
+        self.reset()
+
+    def reset(self) -> None:
+        self.rec.Reset()
+        self._segments = []
+        self._partial = ""
+        self._unchanged = 0
+        self._reported = ""
+
+    @property
+    def text(self) -> str:
+        return " ".join(s for s in self._segments + [self._partial] if s)
+
+    def accept(self, frame: bytes) -> str:
+        if self.rec.AcceptWaveform(frame):
+            segment = json.loads(self.rec.Result()).get("text", "").strip()
+            if segment:
+                self._segments.append(segment)
+            self._partial = ""
+            self._unchanged = 0
+        else:
+            partial = json.loads(self.rec.PartialResult()).get("partial", "").strip()
+            if partial == self._partial:
+                self._unchanged += 1
+            else:
+                self._partial = partial
+                self._unchanged = 0
+        return self.text
+
+    def stable_text(self) -> Optional[str]:
+        # Returns the running transcript once it has stopped changing for
+        # stable_frames frames; each distinct transcript is reported only once.
+        text = self.text
+        if self._unchanged < self.stable_frames or text == self._reported:
+            return None
+        if len(text.split()) < self.min_stable_words:
+            return None
+        self._reported = text
+        return text
+
+    def finish(self) -> str:
+        final = json.loads(self.rec.FinalResult()).get("text", "").strip()
+        if final:
+            self._segments.append(final)
+        self._partial = ""
+        return self.text
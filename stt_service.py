@@ -0,0 +1,129 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+import runtime
+from audio_frontend import FRAME_BYTES, SAMPLE_RATE
+from streaming_stt import StreamingTranscriber
+
+# ================= CONFIG =================
+# Browsers send 16 kHz mono 16-bit little-endian PCM. Recognizers are created
+# lazily up to STT_POOL_SIZE and reused, so the Vosk model is loaded once and
+# each request only pays for Reset().
+STT_POOL_SIZE = 2
+STT_ACQUIRE_TIMEOUT = 10.0
+MAX_UPLOAD_SECONDS = 60
+MAX_UPLOAD_BYTES = MAX_UPLOAD_SECONDS * SAMPLE_RATE * 2
+
+
+class PoolBusy(Exception):
+    pass
+
+
+class RecognizerPool:
+    def __init__(self, size: int = STT_POOL_SIZE, sample_rate: int = SAMPLE_RATE) -> None:
+        self.size = size
+        self.sample_rate = sample_rate
+        self.created = 0
+        self.in_use = 0
+        self.requests = 0
+        self._idle: "queue.LifoQueue[StreamingTranscriber]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _take(self, timeout: float) -> StreamingTranscriber:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if create:
+            try:
+                return StreamingTranscriber(runtime.get_vosk_model(), self.sample_rate)
+            except Exception:
+                with self._lock:
+                    self.created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolBusy()
+
+    def checkout(self, timeout: float = STT_ACQUIRE_TIMEOUT) -> StreamingTranscriber:
+        transcriber = self._take(timeout)
+        transcriber.reset()
+        with self._lock:
+            self.in_use += 1
+            self.requests += 1
+        return transcriber
+
+    def checkin(self, transcriber: StreamingTranscriber) -> None:
+        with self._lock:
+            self.in_use -= 1
+        self._idle.put(transcriber)
+
+    @contextmanager
+    def acquire(self, timeout: float = STT_ACQUIRE_TIMEOUT):
+        transcriber = self.checkout(timeout)
+        try:
+            yield transcriber
+        finally:
+            self.checkin(transcriber)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "created": self.created,
+            "in_use": self.in_use,
+            "requests": self.requests,
+        }
+
+
+class PCMFramer:
+    # Re-slices arbitrary upload chunks into whole FRAME_BYTES frames; a
+    # trailing odd byte is kept until the next chunk arrives.
+    def __init__(self, frame_bytes: int = FRAME_BYTES) -> None:
+        self.frame_bytes = frame_bytes
+        self.total = 0
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> list:
+        self.total += len(chunk)
+        self._buffer.extend(chunk)
+        cut = len(self._buffer) - len(self._buffer) % self.frame_bytes
+        frames = [bytes(self._buffer[i:i + self.frame_bytes]) for i in range(0, cut, self.frame_bytes)]
+        del self._buffer[:cut]
+        return frames
+
+    def flush(self) -> bytes:
+        tail = bytes(self._buffer[:len(self._buffer) - len(self._buffer) % 2])
+        self._buffer.clear()
+        return tail
+
+
+pool = RecognizerPool()
+
+
+def transcribe_with(transcriber: StreamingTranscriber, chunks) -> str:
+    # chunks is any iterable of raw PCM bytes (e.g. a chunked request body).
+    framer = PCMFramer()
+    for chunk in chunks:
+        for frame in framer.feed(chunk):
+            transcriber.accept(frame)
+        if framer.total > MAX_UPLOAD_BYTES:
+            break
+    tail = framer.flush()
+    if tail:
+        transcriber.accept(tail)
+    return transcriber.finish()
+
+
+def transcribe_chunks(chunks) -> str:
+    with pool.acquire() as transcriber:
+        return transcribe_with(transcriber, chunks)
+
+
+def transcribe_pcm(pcm: bytes) -> str:
+    return transcribe_chunks([pcm])
@@ -0,0 +1,91 @@
+import re
+import shutil
+import subprocess
+import time
+from typing import Callable, List
+
+# ================= SENTENCE SPLITTING =================
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+ABBREVIATIONS = {"sec.", "no.", "u/s.", "e.g.", "i.e.", "etc.", "mr.", "mrs.", "dr.", "vs.", "rs."}
+
+
+class SentenceBuffer:
+    # Accumulates streamed tokens and hands back complete sentences as soon as
+    # a boundary is seen, so speech can start before generation ends.
+    def __init__(self) -> None:
+        self._buffer = ""
+
+    def feed(self, token: str) -> List[str]:
+        self._buffer += token
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            candidate = self._buffer[start:match.start()].strip()
+            last_word = candidate.rsplit(" ", 1)[-1].lower() if candidate else ""
+            if last_word in ABBREVIATIONS:
+                continue
+            if candidate:
+                sentences.append(candidate)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return [rest] if rest else []
+
+
+def split_sentences(text: str) -> List[str]:
+    buffer = SentenceBuffer()
+    return buffer.feed(text) + buffer.flush()
+
+
+# ================= BACKENDS =================
+class Pyttsx3Backend:
+    # pyttsx3 is not thread-safe: create and use this from a single thread.
+    def __init__(self, rate: int = 170) -> None:
+        import pyttsx3
+
+        self.engine = pyttsx3.init()
+        self.engine.setProperty("rate", rate)
+        self._should_stop: Callable[[], bool] = lambda: False
+        self.engine.connect("started-word", self._on_word)
+
+    def _on_word(self, name, location, length) -> None:
+        if self._should_stop():
+            self.engine.stop()
+
+    def speak(self, text: str, should_stop: Callable[[], bool] = lambda: False) -> None:
+        self._should_stop = should_stop
+        self.engine.say(text)
+        self.engine.runAndWait()
+
+
+class EspeakBackend:
+    def __init__(self, rate: int = 170, voice: str = "en") -> None:
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        if self.binary is None:
+            raise RuntimeError("espeak-ng is not installed")
+        self.rate = rate
+        self.voice = voice
+
+    def speak(self, text: str, should_stop: Callable[[], bool] = lambda: False) -> None:
+        process = subprocess.Popen([self.binary, "-s", str(self.rate), "-v", self.voice, text])
+        while process.poll() is None:
+            if should_stop():
+                process.kill()
+                break
+            time.sleep(0.05)
+
+
+TTS_BACKENDS = {
+    "pyttsx3": Pyttsx3Backend,
+    "espeak": EspeakBackend,
+}
+
+
+def create_backend(name: str = "pyttsx3", **kwargs):
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"Unknown TTS backend: {name}")
+    return TTS_BACKENDS[name](**kwargs)
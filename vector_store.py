@@ -1,64 +1,157 @@
-import os
+import argparse
+import hashlib
+import json
 from pathlib import Path
 
-import chromadb
-from sentence_transformers import SentenceTransformer
-
-BASE_DIR = Path(__file__).resolve().parent
-CACHE_DIR = BASE_DIR / ".cache"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-os.environ.setdefault("HF_HOME", str(CACHE_DIR / "hf"))
-os.environ.setdefault("TRANSFORMERS_CACHE", str(CACHE_DIR / "hf"))
-os.environ.setdefault("SENTENCE_TRANSFORMERS_HOME", str(CACHE_DIR / "sentence-transformers"))
-
-
-def load_legal_data(path):
-    with open(path, "r", encoding="utf-8") as file:
-        return file.read()
-
-
-def chunk_by_section(text):
-    lines = text.split("\n")
-    chunks = []
-    current_chunk = ""
-
-    for line in lines:
-        line = line.strip()
-        if not line:
+import runtime
+from legal_metadata import link_sections
+from runtime import BASE_DIR, DB_PATH
+
+DATA_PATH = BASE_DIR / "data" / "ipc.txt"
+EMBED_BATCH_SIZE = 256
+INDEX_VERSION_FILE = "index_version"
+SECTION_LINKS_FILE = "section_links.json"
+
+
+def chunk_id(chunk: str) -> str:
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+
+def collection_dir(name: str = runtime.COLLECTION_NAME) -> Path:
+    # Where the version and link files of a collection live. The default
+    # collection keeps them at the top of DB_PATH; shards get a sub-directory.
+    return DB_PATH if name == runtime.COLLECTION_NAME else DB_PATH / "collections" / name
+
+
+def read_index_version(db_path: Path = DB_PATH) -> str:
+    try:
+        return (Path(db_path) / INDEX_VERSION_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return ""
+
+
+def write_index_version(version: str, db_path: Path = DB_PATH) -> None:
+    # Readers (e.g. the answer caches) compare this value to detect rebuilds.
+    path = Path(db_path) / INDEX_VERSION_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(version, encoding="utf-8")
+
+
+def read_section_links(db_path: Path = DB_PATH) -> dict:
+    try:
+        return json.loads((Path(db_path) / SECTION_LINKS_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def write_section_links(links: dict, db_path: Path = DB_PATH) -> None:
+    path = Path(db_path) / SECTION_LINKS_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(links), encoding="utf-8")
+
+
+def build_index(chunks, collection, model, batch_size: int = EMBED_BATCH_SIZE,
+                write_batch_size: int = 0) -> dict:
+    # Ids are content hashes, so unchanged sections keep their id across runs
+    # and only new or edited text needs a forward pass. Chunks are consumed as
+    # a stream; only ids, metadata and the pending batch are kept in memory.
+    # A chunk is a string or a (text, metadata) pair; metadata that changed
+    # for unchanged text is updated without re-embedding.
+    write_batch = min(batch_size, write_batch_size) if write_batch_size else batch_size
+    data = collection.get(include=["metadatas"])
+    existing = dict(zip(data["ids"], data["metadatas"]))
+    seen = set()
+    records = []
+    pending_ids = []
+    pending_docs = []
+    pending_meta = []
+    retagged_ids = []
+    retagged_meta = []
+    added = 0
+    retagged = 0
+
+    def flush() -> None:
+        embeddings = model.encode(pending_docs, batch_size=batch_size, show_progress_bar=False)
+        extra = {"metadatas": list(pending_meta)} if any(pending_meta) else {}
+        collection.upsert(
+            ids=list(pending_ids),
+            documents=list(pending_docs),
+            embeddings=embeddings.tolist(),
+            **extra
+        )
+        pending_ids.clear()
+        pending_docs.clear()
+        pending_meta.clear()
+
+    def flush_metadata() -> None:
+        collection.update(ids=list(retagged_ids), metadatas=list(retagged_meta))
+        retagged_ids.clear()
+        retagged_meta.clear()
+
+    for chunk in chunks:
+        chunk, metadata = chunk if isinstance(chunk, tuple) else (chunk, None)
+        cid = chunk_id(chunk)
+        if cid in seen:
             continue
-
-        if line.startswith("IPC Section"):
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = line
-        else:
-            current_chunk += " " + line
-
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-
-    return chunks
+        seen.add(cid)
+        if metadata:
+            records.append((cid, metadata))
+        if cid in existing:
+            if metadata and existing[cid] != metadata:
+                retagged += 1
+                retagged_ids.append(cid)
+                retagged_meta.append(metadata)
+                if len(retagged_ids) >= write_batch:
+                    flush_metadata()
+            continue
+        pending_ids.append(cid)
+        pending_docs.append(chunk)
+        pending_meta.append(metadata)
+        added += 1
+        if len(pending_ids) >= write_batch:
+            flush()
+
+    if pending_ids:
+        flush()
+    if retagged_ids:
+        flush_metadata()
+
+    stale = [cid for cid in existing if cid not in seen]
+    for start in range(0, len(stale), write_batch):
+        collection.delete(ids=stale[start:start + write_batch])
+    if hasattr(collection, "persist"):
+        # mmap_index collections buffer writes until persist().
+        collection.persist()
+
+    version = hashlib.sha1("\n".join(sorted(seen)).encode("utf-8")).hexdigest()
+
+    return {
+        "version": version,
+        "total": len(seen),
+        "added": added,
+        "deleted": len(stale),
+        "unchanged": len(seen) - added,
+        "retagged": retagged,
+        "links": link_sections(records),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or update the legal vector index.")
+    parser.add_argument("--data", default=str(DATA_PATH), help="Source text file")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--rebuild", action="store_true", help="Drop the collection and re-embed everything")
+    args = parser.parse_args()
+
+    # Runs inside the warm runtime daemon when one is up, otherwise in-process.
+    stats = runtime.ingest(str(Path(args.data).resolve()), batch_size=args.batch_size, rebuild=args.rebuild)
+
+    print(
+        f"Index updated: {stats['added']} added, {stats['deleted']} deleted, "
+        f"{stats['unchanged']} unchanged ({stats['total']} total), "
+        f"{stats['retagged']} metadata updates, {stats['links']} definition/punishment links"
+    )
 
 
 if __name__ == "__main__":
-    text = load_legal_data("data/ipc.txt")
-    chunks = chunk_by_section(text)
-
-    print(f"Chunks loaded: {len(chunks)}")
-
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-
-    db_path = BASE_DIR / "chroma_db"
-    client = chromadb.PersistentClient(path=str(db_path))
-    collection = client.get_or_create_collection(name="legal_laws")
-
-    for i, chunk in enumerate(chunks):
-        embedding = model.encode(chunk).tolist()
-
-        collection.add(
-            documents=[chunk],
-            embeddings=[embedding],
-            ids=[str(i)]
-        )
-
-    print("Embeddings created & stored in Vector DB")
+    main()
@@ -1,47 +1,59 @@
-import json
-import audioop
+import queue
+import threading
 import time
-from pathlib import Path
+from collections import deque
 
 import pyaudio
-import vosk
-import webrtcvad
-import pyttsx3
-import chromadb
-from sentence_transformers import SentenceTransformer
-import ollama
-
-# ================= PATHS =================
-BASE_DIR = Path(__file__).resolve().parent
-VOSK_MODEL = BASE_DIR / "vosk-model-small-en-us-0.15"
-DB_PATH = BASE_DIR / "chroma_db"
-
-# ================= CHECKS =================
-if not VOSK_MODEL.exists():
-    raise FileNotFoundError(f"Vosk model not found at {VOSK_MODEL}")
+
+import runtime
+from answer_cache import AnswerCache
+from audio_frontend import (
+    CHANNELS,
+    FRAME_DURATION_MS,
+    FRAME_SIZE,
+    SAMPLE_RATE,
+    SpeechDetector,
+    UtteranceSegmenter,
+    calibrate_stream,
+    iter_frames,
+)
+from conversation import ConversationSummarizer, format_turns, history_messages
+from lexical_index import CITATION_PATTERN
+from llm_client import LLM_UNAVAILABLE, CircuitOpen, LLMError
+from prefetch import RetrievalPrefetcher
+from prompts import build_messages, build_summary_prompt
+from runtime import DB_PATH, LLM_MODEL
+from session_store import MemorySessionStore
+from streaming_stt import StreamingTranscriber
+from tts import SentenceBuffer, create_backend, split_sentences
+from vector_store import read_index_version
 
 # ================= INIT =================
 print("Initializing components...")
 
-# ---------- AUDIO CONFIG ----------
-SAMPLE_RATE = 16000
-CHANNELS = 1
-FRAME_DURATION_MS = 30
-FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
-FRAME_BYTES = FRAME_SIZE * 2
-MAX_SILENCE_FRAMES = int(0.8 * 1000 / FRAME_DURATION_MS)
-MIN_SPEECH_FRAMES = int(0.2 * 1000 / FRAME_DURATION_MS)
-START_TIMEOUT_SECONDS = 6
-NOISE_MULTIPLIER = 1.3
-MIN_NOISE_FLOOR = 200
+# ---------- PIPELINE CONFIG ----------
+# Capture, STT, RAG and TTS run in their own threads joined by bounded queues.
+# While the assistant is generating or speaking, louder sustained speech
+# (barge-in) cancels the current turn.
+FRAME_QUEUE_SIZE = 256
+QUERY_QUEUE_SIZE = 4
+SPEECH_QUEUE_SIZE = 16
+BARGE_IN_FRAMES = int(0.25 * 1000 / FRAME_DURATION_MS)
+BARGE_IN_MULTIPLIER = 2.0
+EXIT_PHRASES = ("band karo", "exit")
+
+# ---------- TTS CONFIG ----------
+# Answers are spoken sentence by sentence while Ollama is still generating.
+# Backends are defined in tts.py ("pyttsx3", "espeak").
+TTS_BACKEND = "pyttsx3"
+TTS_RATE = 170
 
 # Speech-to-Text
-stt_model = vosk.Model(str(VOSK_MODEL))
-rec = vosk.KaldiRecognizer(stt_model, SAMPLE_RATE)
-rec.SetWords(True)
+stt_model = runtime.get_vosk_model()
+transcriber = StreamingTranscriber(stt_model, SAMPLE_RATE)
 
-# VAD
-vad = webrtcvad.Vad(1)
+# VAD / energy front-end (audio_frontend.py)
+detector = SpeechDetector()
 
 p = pyaudio.PyAudio()
 stream = p.open(
@@ -54,92 +66,77 @@ stream = p.open(
 stream.start_stream()
 
 
-def calibrate_noise(seconds: float = 1.0) -> int:
-    frames = []
-    end_time = time.time() + seconds
-    while time.time() < end_time:
-        data = stream.read(FRAME_SIZE, exception_on_overflow=False)
-        frames.append(data)
-    rms_values = [audioop.rms(f, 2) for f in frames]
-    base_noise = int(sum(rms_values) / max(1, len(rms_values)))
-    return max(MIN_NOISE_FLOOR, int(base_noise * NOISE_MULTIPLIER))
-
-
 print("Stay silent for calibration...")
 time.sleep(0.3)
-noise_threshold = calibrate_noise()
+noise_threshold = calibrate_stream(stream, detector)
 
-# Text-to-Speech
-engine = pyttsx3.init()
-engine.setProperty("rate", 170)
-
-# Vector DB
-client = chromadb.PersistentClient(path=str(DB_PATH))
-collection = client.get_or_create_collection("legal_laws")
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+# Vector DB and embedder: served by the warm runtime daemon when it is up,
+# otherwise loaded into this process now.
+if not runtime.daemon_running():
+    runtime.warm_up()
+threading.Thread(target=runtime.prime_llm, daemon=True).start()
 
 # LLM settings
-MODEL_NAME = "mistral"
+MODEL_NAME = LLM_MODEL
+llm = runtime.get_llm(MODEL_NAME)
 MAX_HISTORY_TURNS = 6
-chat_history = []
+VOICE_SESSION = "voice"
+chat_history = MemorySessionStore(max_turns=2 * MAX_HISTORY_TURNS)
 BLOCKED_PHRASES = [
     "Personal data shall be collected and processed solely for lawful purposes directly related to the performance of this Agreement and shall not be used in any manner inconsistent with such purposes."
 ]
 
+# Answers are reused only for the same retrieved sections and history, and the
+# cache is dropped whenever vector_store.py rebuilds the index.
+answer_cache = AnswerCache(
+    threshold=0.95,
+    ttl_seconds=6 * 3600,
+    maxsize=512,
+    version_fn=lambda: read_index_version(DB_PATH)
+)
+
+# Retrieval for a stable partial transcript starts while the user is still
+# talking; rag_answer picks it up if the final transcript matches.
+prefetcher = RetrievalPrefetcher(runtime.retrieve, workers=1, maxsize=1)
+
+# ---------- PIPELINE STATE ----------
+frames_q = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+queries_q = queue.Queue(maxsize=QUERY_QUEUE_SIZE)
+speech_q = queue.Queue(maxsize=SPEECH_QUEUE_SIZE)
+stop_event = threading.Event()
+generating = threading.Event()
+speaking = threading.Event()
+turn_lock = threading.Lock()
+current_turn = 0
+
 print("Voice Legal Agent READY")
 print(f"Noise threshold: {noise_threshold}")
 print("Say 'band karo' to stop.\n")
 
 # ================= FUNCTIONS =================
 
-def listen():
-    speech_frames = []
-    silence_frames = 0
-    started = False
-    start_time = time.time()
+def _prefetch(text: str) -> None:
+    prefetcher.submit(VOICE_SESSION, text)
 
-    while True:
-        frame = stream.read(FRAME_SIZE, exception_on_overflow=False)
-        is_speech = vad.is_speech(frame, SAMPLE_RATE)
-        rms = audioop.rms(frame, 2)
-
-        is_loud = rms >= noise_threshold
-        if is_speech or is_loud:
-            if not started:
-                started = True
-            speech_frames.append(frame)
-            silence_frames = 0
-        elif started:
-            silence_frames += 1
-            if silence_frames >= MAX_SILENCE_FRAMES:
-                break
-        elif time.time() - start_time > START_TIMEOUT_SECONDS:
-            return ""
-
-    if len(speech_frames) < MIN_SPEECH_FRAMES:
-        return ""
-
-    rec.Reset()
-    for f in speech_frames:
-        rec.AcceptWaveform(f)
-    return json.loads(rec.FinalResult()).get("text", "").strip()
-
-
-def speak(text):
-    print("Assistant speaking...")
-    engine.say(text)
-    engine.runAndWait()
-
-
-def _history_text() -> str:
-    if not chat_history:
-        return ""
-    lines = []
-    for item in chat_history[-MAX_HISTORY_TURNS:]:
-        role = item.get("role", "user")
-        content = item.get("content", "")
-        lines.append(f"{role.capitalize()}: {content}")
-    return "\n".join(lines)
+
+def _take_prefetched(query: str):
+    return prefetcher.take(VOICE_SESSION, query)
+
+
+def _summarize(previous: str, turns: str) -> str:
+    return llm.chat(
+        [{"role": "user", "content": build_summary_prompt(previous, turns)}],
+        num_predict=200
+    )
+
+
+# Older turns are folded into a rolling summary in the background so long
+# conversations do not keep growing the prompt.
+summarizer = ConversationSummarizer(chat_history, _summarize)
+
+
+def _history() -> list:
+    return history_messages(chat_history, VOICE_SESSION, MAX_HISTORY_TURNS)
 
 
 def _clean_answer(text: str) -> str:
@@ -149,93 +146,254 @@ def _clean_answer(text: str) -> str:
     return cleaned
 
 
-def rag_answer(query):
+def _stream_chat(messages, cancelled, on_sentence):
+    parts = []
+    sentences = SentenceBuffer()
+    for token in llm.stream(messages):
+        if cancelled():
+            return None
+        parts.append(token)
+        for sentence in sentences.feed(token):
+            _emit_sentence(sentence, on_sentence)
+    for sentence in sentences.flush():
+        _emit_sentence(sentence, on_sentence)
+    return "".join(parts)
+
+
+def _emit_sentence(sentence, on_sentence) -> None:
+    # Blocked phrases are whole sentences, so cleaning each sentence as it
+    # completes gives the same result as cleaning the full answer.
+    cleaned = _clean_answer(sentence)
+    if cleaned and on_sentence is not None:
+        on_sentence(cleaned)
+
+
+def rag_answer(query, cancelled=lambda: False, on_sentence=None):
+    # Returns None when the turn was cancelled (barge-in) before generation
+    # finished. Generated sentences are passed to on_sentence as they complete.
     print("RAG thinking...")
-    if len(query.split()) < 4:
+    if len(query.split()) < 4 and not CITATION_PATTERN.search(query):
         return (
             "Please share more details so I can guide you. "
             "For example: what happened, where, when, who is involved, and what outcome you want."
         )
-    q_emb = embedder.encode(query).tolist()
-    res = collection.query(query_embeddings=[q_emb], n_results=1)
-    context = res["documents"][0][0]
+    found = _take_prefetched(query) or runtime.retrieve(query)
+    sections, q_emb = found["sections"], found["embedding"]
+    section_ids = [section["id"] for section in sections]
+
+    history_turns = _history()
+    history = format_turns(history_turns)
+    cached = answer_cache.lookup(query, q_emb, section_ids, history)
+    if cached is not None:
+        return cached
 
-    history = _history_text()
+    messages = build_messages(sections, history_turns, query)
 
-    prompt = f"""
-You are an Indian legal assistant.
-Use ONLY the context below.
-You MUST mention IPC Section number.
-Your job is to help the user understand their situation and guide them with next steps.
-If details are missing, ask 3 short clarification questions first.
-Keep the response simple, structured, and practical.
-Do NOT include unrelated policy text or boilerplate.
+    try:
+        raw = _stream_chat(messages, cancelled, on_sentence)
+    except CircuitOpen:
+        return LLM_UNAVAILABLE
+    except LLMError:
+        return "LLM error. Please retry."
 
-Format:
-1) Summary of the situation in 1-2 lines.
-2) Relevant IPC section(s).
-3) What the user can do next (3-5 bullet steps).
-4) Clarifying questions (if needed).
-5) End with the exact disclaimer sentence.
+    if raw is None:
+        return None
+    answer = _clean_answer(raw)
+    answer_cache.store(query, q_emb, section_ids, answer, history)
+    return answer
 
-Context:
-{context}
 
-Conversation so far:
-{history}
+def _new_turn() -> int:
+    global current_turn
+    with turn_lock:
+        current_turn += 1
+        return current_turn
 
-Question:
-{query}
 
-End with exactly:
-This is for educational purposes only. Consult a licensed lawyer for legal advice.
-"""
+def _is_current(turn: int) -> bool:
+    with turn_lock:
+        return turn == current_turn
 
-    try:
-        response = ollama.chat(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return _clean_answer(response["message"]["content"])
-    except Exception as exc:
-        err_text = str(exc).lower()
-        if "cuda" in err_text or "gpu" in err_text:
+
+def _drain(q: queue.Queue) -> None:
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
+
+
+def interrupt() -> None:
+    # Barge-in: invalidate the running turn so generation stops at the next
+    # token and pending/in-progress speech is dropped.
+    _new_turn()
+    _drain(speech_q)
+    print("\n[Interrupted]")
+
+
+# ================= PIPELINE WORKERS =================
+
+def capture_worker():
+    # Keeps reading the microphone at all times so the PyAudio buffer never
+    # overflows; if STT falls behind, the oldest frames are dropped.
+    while not stop_event.is_set():
+        frame = stream.read(FRAME_SIZE, exception_on_overflow=False)
+        try:
+            frames_q.put_nowait(frame)
+        except queue.Full:
             try:
-                response = ollama.chat(
-                    model=MODEL_NAME,
-                    messages=[{"role": "user", "content": prompt}],
-                    options={"num_gpu": 0}
-                )
-                return _clean_answer(response["message"]["content"])
-            except Exception:
-                return "Ollama GPU error. Start Ollama in CPU mode and retry."
-        return "LLM error. Please retry."
+                frames_q.get_nowait()
+            except queue.Empty:
+                pass
+            frames_q.put_nowait(frame)
 
 
-# ================= MAIN LOOP =================
-try:
+def _next_block() -> bytes:
+    # Everything queued since the last call is processed as one block.
+    frames = [frames_q.get(timeout=0.5)]
     while True:
-        print("Listening...")
-        query = listen()
-        print("You said:", query)
+        try:
+            frames.append(frames_q.get_nowait())
+        except queue.Empty:
+            return b"".join(frames)
+
+
+def stt_worker():
+    segmenter = UtteranceSegmenter()
+    loud_run = 0
+    preroll = deque(maxlen=BARGE_IN_FRAMES)
+    transcriber.reset()
+
+    while not stop_event.is_set():
+        try:
+            block = _next_block()
+        except queue.Empty:
+            continue
 
-        if not query:
+        flags, rms_values = detector.process(block)
+        for frame, is_speech, rms in zip(iter_frames(block), flags, rms_values):
+            if not segmenter.started and (generating.is_set() or speaking.is_set()):
+                # Require louder, sustained speech so our own TTS output picked
+                # up by the mic does not interrupt itself.
+                preroll.append(frame)
+                loud = is_speech and rms >= detector.threshold * BARGE_IN_MULTIPLIER
+                loud_run = loud_run + 1 if loud else 0
+                if loud_run < BARGE_IN_FRAMES:
+                    continue
+                interrupt()
+                for buffered in preroll:
+                    segmenter.push(True)
+                    transcriber.accept(buffered)
+                preroll.clear()
+                loud_run = 0
+                continue
+
+            state = segmenter.push(bool(is_speech))
+            if state == "idle":
+                continue
+
+            partial = transcriber.accept(frame)
+            if partial:
+                print(f"\r... {partial}", end="", flush=True)
+            stable = transcriber.stable_text()
+            if stable:
+                _prefetch(stable)
+
+            if state == "end":
+                print()
+                text = transcriber.finish() if segmenter.long_enough else ""
+                if text:
+                    print("You said:", text)
+                    queries_q.put(text)
+                transcriber.reset()
+                segmenter.reset()
+                print("Listening...")
+
+
+def rag_worker():
+    while not stop_event.is_set():
+        try:
+            query = queries_q.get(timeout=0.5)
+        except queue.Empty:
             continue
 
-        if "band karo" in query or "exit" in query:
-            speak("Theek hai, main band ho raha hoon.")
-            break
+        turn = _new_turn()
+        _drain(speech_q)
+
+        if any(phrase in query for phrase in EXIT_PHRASES):
+            speech_q.put((turn, "Theek hai, main band ho raha hoon."))
+            speech_q.put((turn, None))
+            return
+
+        streamed = []
+
+        def queue_sentence(sentence):
+            if _is_current(turn):
+                streamed.append(sentence)
+                speech_q.put((turn, sentence))
+
+        generating.set()
+        try:
+            answer = rag_answer(query, cancelled=lambda: not _is_current(turn), on_sentence=queue_sentence)
+        finally:
+            generating.clear()
+        if answer is None or not _is_current(turn):
+            continue
 
-        answer = rag_answer(query)
         print("\nAgent Reply:\n", answer)
-        speak(answer)
-        chat_history.append({"role": "user", "content": query})
-        chat_history.append({"role": "assistant", "content": answer})
+        chat_history.append(VOICE_SESSION, "user", query)
+        chat_history.append(VOICE_SESSION, "assistant", answer)
+        summarizer.maybe_schedule(VOICE_SESSION)
+        if not streamed:
+            # Cached, short-query and error replies arrive in one piece.
+            for sentence in split_sentences(answer):
+                speech_q.put((turn, sentence))
+
+
+def tts_worker():
+    # The backend (e.g. the pyttsx3 engine) is created and used only here.
+    backend = create_backend(TTS_BACKEND, rate=TTS_RATE)
+
+    while not stop_event.is_set():
+        try:
+            turn, text = speech_q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if text is None:
+            stop_event.set()
+            return
+        if not _is_current(turn):
+            continue
+
+        speaking.set()
+        try:
+            backend.speak(text, should_stop=lambda: not _is_current(turn))
+        finally:
+            speaking.clear()
+
+
+# ================= MAIN LOOP =================
+workers = [
+    threading.Thread(target=capture_worker, name="capture", daemon=True),
+    threading.Thread(target=stt_worker, name="stt", daemon=True),
+    threading.Thread(target=rag_worker, name="rag", daemon=True),
+    threading.Thread(target=tts_worker, name="tts", daemon=True),
+]
+
+try:
+    print("Listening...")
+    for worker in workers:
+        worker.start()
+    while not stop_event.is_set():
+        stop_event.wait(0.5)
 
 except KeyboardInterrupt:
     print("\nManually stopped")
 
 finally:
+    stop_event.set()
+    for worker in workers:
+        worker.join(timeout=2)
     stream.stop_stream()
     stream.close()
     p.terminate()
@@ -1,14 +1,23 @@
 import os
 import subprocess
 import sys
+import threading
 from pathlib import Path
 
 import tkinter as tk
-from tkinter import scrolledtext
+from tkinter import scrolledtext, simpledialog
+
+import runtime
 
 # ================= PATHS =================
 BASE_DIR = Path(__file__).resolve().parent
 
+# Tools run inside the launcher while the warm runtime is up: retrieval, chat
+# and ingest go to the daemon and nothing is reloaded. The voice scripts own a
+# microphone loop and stay separate processes (they use the daemon themselves).
+WARM_TOOLS = ("vector_store.py", "query_search.py", "generate_answer.py", "load_data.py", "chunking.py")
+QUESTION_TOOLS = ("query_search.py", "generate_answer.py")
+
 # ================= UI =================
 class VoiceLegalUI:
     def __init__(self, root: tk.Tk) -> None:
@@ -102,6 +111,7 @@ class VoiceLegalUI:
 
         greeting = "Hello, I am your Legal Advisor. How can I assist you?"
         self._append_chat("Assistant", greeting)
+        self.root.after(100, self.start_runtime_daemon)
         self.root.after(300, self.start_main_assistant)
 
     def _add_tool_button(self, parent: tk.Frame, label: str, script: str, row: int, col: int) -> None:
@@ -116,7 +126,18 @@ class VoiceLegalUI:
         )
         btn.grid(row=row, column=col, padx=6, pady=4)
 
-    def _run_script(self, script_name: str) -> None:
+    def start_runtime_daemon(self) -> None:
+        # The daemon keeps the embedder and Chroma loaded so tools launched
+        # from here (see WARM_TOOLS) and the CLIs skip the model cold start.
+        if self._is_running("runtime.py") or runtime.daemon_running():
+            return
+        self._run_script("runtime.py", "--serve")
+
+    def _run_script(self, script_name: str, *args: str) -> None:
+        if script_name in WARM_TOOLS and runtime.daemon_running():
+            self._run_in_daemon(script_name)
+            return
+
         script_path = BASE_DIR / script_name
         if not script_path.exists():
             self._append_chat("System", f"Missing: {script_name}")
@@ -128,7 +149,7 @@ class VoiceLegalUI:
 
         try:
             process = subprocess.Popen(
-                [sys.executable, str(script_path)],
+                [sys.executable, str(script_path), *args],
                 cwd=str(BASE_DIR),
                 creationflags=creation_flags
             )
@@ -137,6 +158,45 @@ class VoiceLegalUI:
         except Exception as exc:
             self._append_chat("System", f"Failed to start {script_name}: {exc}")
 
+    def _run_in_daemon(self, script_name: str) -> None:
+        query = None
+        if script_name in QUESTION_TOOLS:
+            query = simpledialog.askstring("Legal question", "Enter your legal question:", parent=self.root)
+            if not query or not query.strip():
+                return
+            self._append_chat("You", query)
+        else:
+            self._append_chat("System", f"Running in warm runtime: {script_name}")
+
+        def work() -> None:
+            try:
+                role, message = self._tool_result(script_name, query)
+            except Exception as exc:
+                role, message = "System", f"Failed to run {script_name}: {exc}"
+            self.root.after(0, lambda: self._append_chat(role, message))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def _tool_result(self, script_name: str, query: str) -> tuple:
+        if script_name == "vector_store.py":
+            stats = runtime.ingest()
+            return "System", (
+                f"Index updated: {stats['added']} added, {stats['deleted']} deleted, "
+                f"{stats['unchanged']} unchanged ({stats['total']} total)"
+            )
+        if script_name in ("load_data.py", "chunking.py"):
+            from chunking import iter_sections
+            from vector_store import DATA_PATH
+            count = sum(1 for _ in iter_sections(DATA_PATH))
+            return "System", f"Legal data loaded: {count} sections in {DATA_PATH.name}"
+
+        sections = runtime.retrieve(query.strip())["sections"]
+        if script_name == "query_search.py":
+            lines = [f"[{s['label'] or s['id']}] (distance {s['distance']:.3f})" for s in sections]
+            return "System", "\n".join(lines) or "No matching sections."
+        from prompts import build_messages
+        return "Assistant", runtime.chat(messages=build_messages(sections, [], query.strip()))
+
     def start_main_assistant(self) -> None:
         self.status.config(text="Assistant running")
         if self._is_running("voice_rag_assistant.py"):
@@ -166,12 +226,13 @@ class VoiceLegalUI:
         self.chat.see(tk.END)
 
 
-def on_close(root: tk.Tk) -> None:
+def on_close(root: tk.Tk, ui: VoiceLegalUI) -> None:
+    ui._stop_script("runtime.py")
     root.destroy()
 
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = VoiceLegalUI(root)
-    root.protocol("WM_DELETE_WINDOW", lambda: on_close(root))
+    root.protocol("WM_DELETE_WINDOW", lambda: on_close(root, app))
     root.mainloop()
@@ -1,39 +1,92 @@
-import os
+import json
+import threading
 import uuid
-from pathlib import Path
-
-from flask import Flask, jsonify, render_template, request, session
-import chromadb
-from sentence_transformers import SentenceTransformer
-import ollama
-
-# ================= PATHS =================
-BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "chroma_db"
-
-# Force all model/cache downloads to stay inside project
-CACHE_DIR = BASE_DIR / ".cache"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-os.environ.setdefault("HF_HOME", str(CACHE_DIR / "hf"))
-os.environ.setdefault("TRANSFORMERS_CACHE", str(CACHE_DIR / "hf"))
-os.environ.setdefault("SENTENCE_TRANSFORMERS_HOME", str(CACHE_DIR / "sentence-transformers"))
+from typing import Optional
+
+from flask import Flask, Response, jsonify, render_template, request, session, stream_with_context
+
+import runtime
+import stt_service
+from answer_cache import AnswerCache
+from conversation import ConversationSummarizer, format_turns, history_messages
+from embedding_cache import EmbeddingCache
+from embedding_service import BatchingEmbedder
+from legal_metadata import where_filter
+from lexical_index import CITATION_PATTERN
+from llm_client import LLM_UNAVAILABLE, CircuitOpen, LLMError
+from prefetch import RetrievalPrefetcher
+from prompts import build_messages, build_summary_prompt
+from runtime import BASE_DIR, DB_PATH, EMBED_NAMESPACE, LLM_MODEL, STATE_DIR
+from session_store import create_session_store
+from stt_service import PoolBusy
+from vector_store import read_index_version
 
 # ================= APP =================
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.secret_key = "local-demo-secret"
 
 # ================= RAG =================
-client = chromadb.PersistentClient(path=str(DB_PATH))
-collection = client.get_or_create_collection("legal_laws")
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
-
-MODEL_NAME = "mistral"
+# The embedder, vector collection and LLM client come from runtime.py and
+# are created on first use.
+embedder = runtime.LazyEmbedder()
+
+# Concurrent cache misses are grouped into one encode() call.
+EMBED_MAX_BATCH = 32
+EMBED_MAX_WAIT_MS = 5
+batched_embedder = BatchingEmbedder(embedder, max_batch=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS)
+
+# Query embeddings are cached by normalized text; set EMBED_CACHE_PATH to None
+# to keep the cache in memory only.
+EMBED_CACHE_SIZE = 2048
+EMBED_CACHE_PATH = STATE_DIR / "query_embeddings.sqlite3"
+query_embeddings = EmbeddingCache(
+    batched_embedder,
+    maxsize=EMBED_CACHE_SIZE,
+    path=EMBED_CACHE_PATH,
+    namespace=EMBED_NAMESPACE
+)
+
+MODEL_NAME = LLM_MODEL
 MAX_HISTORY_TURNS = 6
-SESSIONS = {}
+
+# Conversation history per browser session. With a path, history is kept in
+# SQLite (WAL) so it survives restarts and is shared by worker processes; set
+# SESSION_STORE_PATH to None to keep it in memory only.
+SESSION_STORE_PATH = STATE_DIR / "sessions.sqlite3"
+SESSION_MAX_TURNS = 2 * MAX_HISTORY_TURNS
+SESSION_TTL_SECONDS = 6 * 3600
+SESSION_MAX_BYTES = 32 * 1024 * 1024
+sessions = create_session_store(
+    SESSION_STORE_PATH,
+    max_turns=SESSION_MAX_TURNS,
+    ttl_seconds=SESSION_TTL_SECONDS,
+    max_bytes=SESSION_MAX_BYTES
+)
 BLOCKED_PHRASES = [
     "Personal data shall be collected and processed solely for lawful purposes directly related to the performance of this Agreement and shall not be used in any manner inconsistent with such purposes."
 ]
 
+# Answers are reused only for the same retrieved sections and history, and the
+# cache is dropped whenever vector_store.py rebuilds the index.
+answer_cache = AnswerCache(
+    threshold=0.95,
+    ttl_seconds=6 * 3600,
+    maxsize=512,
+    version_fn=lambda: read_index_version(DB_PATH)
+)
+
+
+def _summarize(previous: str, turns: str) -> str:
+    return runtime.get_llm(MODEL_NAME).chat(
+        [{"role": "user", "content": build_summary_prompt(previous, turns)}],
+        num_predict=200
+    )
+
+
+# Older turns are folded into a rolling per-session summary off the request
+# path, so prompt size stays flat over long chats (see conversation.py).
+summarizer = ConversationSummarizer(sessions, _summarize)
+
 
 def _get_session_id() -> str:
     if "sid" not in session:
@@ -41,16 +94,8 @@ def _get_session_id() -> str:
     return session["sid"]
 
 
-def _history_text(session_id: str) -> str:
-    history = SESSIONS.get(session_id, [])
-    if not history:
-        return ""
-    lines = []
-    for item in history[-MAX_HISTORY_TURNS:]:
-        role = item.get("role", "user")
-        content = item.get("content", "")
-        lines.append(f"{role.capitalize()}: {content}")
-    return "\n".join(lines)
+def _history(session_id: str) -> list:
+    return history_messages(sessions, session_id, MAX_HISTORY_TURNS)
 
 def _clean_answer(text: str) -> str:
     cleaned = text
@@ -59,68 +104,113 @@ def _clean_answer(text: str) -> str:
     return cleaned
 
 
-def rag_answer(query: str, session_id: str) -> str:
-    lower_q = query.lower()
-    if "ipc" not in lower_q and len(query.split()) < 4:
-        return (
-            "Please share more details so I can guide you. "
-            "For example: what happened, where, when, who is involved, and what outcome you want."
-        )
+MORE_DETAILS = (
+    "Please share more details so I can guide you. "
+    "For example: what happened, where, when, who is involved, and what outcome you want."
+)
+
+
+def _needs_details(query: str) -> bool:
+    # Short questions are sent back for details, except explicit citations
+    # ("section 420"), which go straight to the section lookup.
+    if CITATION_PATTERN.search(query):
+        return False
+    return "ipc" not in query.lower() and len(query.split()) < 4
+
+
+def _retrieve(query: str, where: Optional[dict] = None) -> tuple:
+    return runtime.search(query, query_embeddings.encode, where)
+
+
+def request_filter(data: dict) -> Optional[dict]:
+    # Optional "filters": {"act": "IPC", "type": "punishment", "chapter": "XVII",
+    # "section": "379"}; each value may also be a list.
+    filters = data.get("filters")
+    return where_filter(**filters) if isinstance(filters, dict) else None
+
+
+# /prefetch starts embedding + retrieval while the user is still typing; the
+# result is kept per session and used if the submitted question matches.
+PREFETCH_WORKERS = 2
+prefetcher = RetrievalPrefetcher(_retrieve, workers=PREFETCH_WORKERS)
+
+
+def _plan_answer(query: str, session_id: str, where: Optional[dict] = None) -> dict:
+    # Everything that happens before the LLM call. "answer" is filled in when
+    # the reply can be given without Ollama (short query or cache hit).
+    plan = {"query": query, "answer": None}
+    if _needs_details(query):
+        plan["answer"] = MORE_DETAILS
+        return plan
+
+    prefetched = prefetcher.take(session_id, query) if where is None else None
+    sections, q_emb = prefetched or _retrieve(query, where)
+    section_ids = [section["id"] for section in sections]
+
+    history_turns = _history(session_id)
+    history = format_turns(history_turns)
+    plan.update(embedding=q_emb, section_ids=section_ids, history=history)
+    cached = answer_cache.lookup(query, q_emb, section_ids, history)
+    if cached is not None:
+        plan["answer"] = cached
+        return plan
 
-    q_emb = embedder.encode(query).tolist()
-    res = collection.query(query_embeddings=[q_emb], n_results=1)
-    context = res["documents"][0][0]
+    plan["messages"] = build_messages(sections, history_turns, query)
+    return plan
 
-    history = _history_text(session_id)
 
-    prompt = f"""
-You are an Indian legal assistant.
-Use ONLY the context below.
-You MUST mention IPC Section number.
-Your job is to help the user understand their situation and guide them with next steps.
-If details are missing, ask 3 short clarification questions first.
-Keep the response simple, structured, and practical.
-Do NOT include unrelated policy text or boilerplate.
+def _finish_answer(plan: dict, raw: str) -> str:
+    answer = _clean_answer(raw)
+    answer_cache.store(plan["query"], plan["embedding"], plan["section_ids"], answer, plan["history"])
+    return answer
 
-Format:
-1) Summary of the situation in 1-2 lines.
-2) Relevant IPC section(s).
-3) What the user can do next (3-5 bullet steps).
-4) Clarifying questions (if needed).
-5) End with the exact disclaimer sentence.
 
-Context:
-{context}
+def _llm_failure(exc: LLMError) -> str:
+    if isinstance(exc, CircuitOpen):
+        return LLM_UNAVAILABLE
+    return "LLM error. Please retry."
 
-Conversation so far:
-{history}
 
-Question:
-{query}
+def rag_answer(query: str, session_id: str, where: Optional[dict] = None) -> str:
+    plan = _plan_answer(query, session_id, where)
+    if plan["answer"] is not None:
+        return plan["answer"]
 
-End with exactly:
-This is for educational purposes only. Consult a licensed lawyer for legal advice.
-"""
+    try:
+        return _finish_answer(plan, runtime.get_llm(MODEL_NAME).chat(plan["messages"]))
+    except LLMError as exc:
+        return _llm_failure(exc)
+
+
+def rag_answer_stream(query: str, session_id: str, where: Optional[dict] = None):
+    # Yields ("token", text) pieces as the LLM produces them, then ("done", answer)
+    # with the cleaned full reply.
+    plan = _plan_answer(query, session_id, where)
+    if plan["answer"] is not None:
+        yield "token", plan["answer"]
+        yield "done", plan["answer"]
+        return
 
+    parts = []
     try:
-        response = ollama.chat(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return _clean_answer(response["message"]["content"])
-    except Exception as exc:
-        err_text = str(exc).lower()
-        if "cuda" in err_text or "gpu" in err_text:
-            try:
-                response = ollama.chat(
-                    model=MODEL_NAME,
-                    messages=[{"role": "user", "content": prompt}],
-                    options={"num_gpu": 0}
-                )
-                return _clean_answer(response["message"]["content"])
-            except Exception:
-                return "Ollama GPU error. Start Ollama in CPU mode and retry."
-        return "LLM error. Please retry."
+        for token in runtime.get_llm(MODEL_NAME).stream(plan["messages"]):
+            parts.append(token)
+            yield "token", token
+    except LLMError as exc:
+        yield "done", _llm_failure(exc)
+        return
+
+    yield "done", _finish_answer(plan, "".join(parts))
+
+
+def _remember_turn(session_id: str, query: str, answer: str) -> None:
+    sessions.append(session_id, "user", query)
+    sessions.append(session_id, "assistant", answer)
+    summarizer.maybe_schedule(session_id)
+
+
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
 
 
 @app.route("/")
@@ -128,9 +218,38 @@ def index():
     return render_template("index.html")
 
 
+def shard_stats():
+    pool = runtime.get_shard_pool()
+    return pool.stats() if pool is not None else None
+
+
 @app.route("/health")
 def health():
-    return jsonify({"status": "ok"})
+    return jsonify({
+        "status": "ok",
+        "embedding_cache": query_embeddings.stats(),
+        "embedding_batches": batched_embedder.stats(),
+        "answer_cache": answer_cache.stats(),
+        "stt_pool": stt_service.pool.stats(),
+        "sessions": sessions.stats(),
+        "summarizer": summarizer.stats(),
+        "llm_client": runtime.get_llm(MODEL_NAME).stats(),
+        "prefetch": prefetcher.stats(),
+        "shards": shard_stats(),
+    })
+
+
+def start_prefetch(query: str, session_id: str) -> bool:
+    if not query or _needs_details(query):
+        return False
+    return prefetcher.submit(session_id, query)
+
+
+@app.route("/prefetch", methods=["POST"])
+def prefetch():
+    data = request.get_json(force=True)
+    query = (data.get("query") or "").strip()
+    return jsonify({"prefetching": start_prefetch(query, _get_session_id())})
 
 
 @app.route("/ask", methods=["POST"])
@@ -141,16 +260,63 @@ def ask():
         return jsonify({"answer": "Please enter a question."})
 
     session_id = _get_session_id()
-    answer = rag_answer(query, session_id)
-
-    history = SESSIONS.setdefault(session_id, [])
-    history.append({"role": "user", "content": query})
-    history.append({"role": "assistant", "content": answer})
+    answer = rag_answer(query, session_id, request_filter(data))
+    _remember_turn(session_id, query, answer)
 
     return jsonify({"answer": answer})
 
 
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    data = request.get_json(force=True)
+    query = (data.get("query") or "").strip()
+    session_id = _get_session_id()
+    where = request_filter(data)
+
+    def events():
+        if not query:
+            yield _sse({"done": True, "answer": "Please enter a question."})
+            return
+        for kind, text in rag_answer_stream(query, session_id, where):
+            if kind == "token":
+                yield _sse({"token": text})
+            else:
+                _remember_turn(session_id, query, text)
+                yield _sse({"done": True, "answer": text})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/transcribe", methods=["POST"])
+def transcribe():
+    # Body: raw 16 kHz mono 16-bit PCM, read in chunks as it arrives.
+    def chunks():
+        while True:
+            chunk = request.stream.read(stt_service.FRAME_BYTES * 16)
+            if not chunk:
+                return
+            yield chunk
+
+    try:
+        text = stt_service.transcribe_chunks(chunks())
+    except PoolBusy:
+        return jsonify({"text": "", "error": "Speech recognizer busy. Please retry."}), 503
+    except FileNotFoundError as exc:
+        return jsonify({"text": "", "error": str(exc)}), 503
+    return jsonify({"text": text})
+
+
+def warm_up() -> None:
+    runtime.warm_up()
+    runtime.prime_llm()
+
+
 if __name__ == "__main__":
+    threading.Thread(target=warm_up, daemon=True).start()
     print("Starting server on http://0.0.0.0:8000")
     print("Open this on another device using your PC IP, for example: http://192.168.x.x:8000")
     app.run(host="0.0.0.0", port=8000, debug=False)